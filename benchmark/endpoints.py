@@ -0,0 +1,284 @@
+"""
+Benchmarks every endpoint of the app in-process, against mocked external services that answer after a random delay
+(normally distributed around '--latency', with a standard deviation of '--jitter', in milliseconds). The weather,
+Ipregistry, BLS and CDC APIs are mocked with 'respx', while Google Trends (which 'pytrends' calls through 'requests')
+is mocked by replacing the query of the Trends processor.
+
+For each endpoint, the latency percentiles (p50, p95 and p99), the throughput and the peak of memory allocated per
+request (traced with 'tracemalloc', in a separate pass) are written into a JSON file. Comparing two of those files
+fails when a metric got worse than the given threshold, when the share of successful (2xx) responses of an endpoint
+dropped at all, or when an endpoint is missing. Run it from the project root with:
+
+    python -m benchmark.endpoints run [--output results.json] [--baseline baseline.json] [--threshold 0.1] ...
+    python -m benchmark.endpoints compare baseline.json results.json [--threshold 0.1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, timedelta
+from importlib import resources
+from typing import Callable, Optional
+
+import httpx
+import numpy as np
+import respx
+from pandas import DataFrame, date_range
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import app  # noqa: E402
+from model import SexType, RaceType, US_STATE_NAMES  # noqa: E402
+from processor import LifeExpectancyProcessor  # noqa: E402
+
+WEATHER_XML = resources.read_binary("test.resources.weather", "day_0.xml")
+WEATHER_JSON = resources.read_binary("test.resources.weather", "day_0.json")
+UNEMPLOYMENT_PAGE = resources.read_text("test.resources", "unemployment.html")
+
+# Whether a higher value of each metric is worse (e.g. latency) or better (e.g. throughput)
+METRICS = {"p50_ms": True, "p95_ms": True, "p99_ms": True, "throughput_rps": False, "peak_kib_per_request": True}
+
+
+@dataclass
+class Latency:
+    """A random delay, in seconds, normally distributed and never negative"""
+    mean: float
+    jitter: float
+    rng: random.Random
+
+    def sample(self) -> float:
+        return max(self.rng.gauss(self.mean, self.jitter), 0.0)
+
+
+def _scenarios(rng: random.Random) -> dict[str, Callable[[], tuple[str, Optional[dict]]]]:
+    """Maps each endpoint to a function that returns the path and query parameters of a new request"""
+    def trends_dates() -> dict:
+        start_date = date(2021, 1, 1) + timedelta(days=rng.randrange(30))
+        return {"start_date": start_date, "end_date": start_date + timedelta(days=rng.randrange(1, 30))}
+
+    return {
+        "health": lambda: ("/health", None),
+        "life_expectancy": lambda: (
+            f"/life_expectancy/{rng.choice(list(SexType)).value}/{rng.choice(list(RaceType)).value}/"
+            f"{rng.randrange(1940, 2000)}", None
+        ),
+        "unemployment": lambda: (f"/unemployment/{rng.choice(list(US_STATE_NAMES))}", None),
+        "trends": lambda: ("/trends", {"phrase": "illo", **trends_dates()}),
+        "trends_weather": lambda: ("/trends_weather", {"phrase": "illo"}),
+        "weather": lambda: ("/weather", None),
+    }
+
+
+def mock_upstreams(router: respx.MockRouter, latency: Latency):
+    """Mocks every external service the app calls, each answering after a random delay"""
+    def delayed(response: Callable[[httpx.Request], httpx.Response]):
+        async def side_effect(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(latency.sample())
+            return response(request)
+
+        return side_effect
+
+    def weather(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=WEATHER_JSON if request.url.path.endswith(".json") else WEATHER_XML)
+
+    def life_expectancy(_: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=[{"average_life_expectancy": f"{latency.rng.uniform(60, 80):.1f}"}])
+
+    def unemployment(_: httpx.Request) -> httpx.Response:
+        time.sleep(latency.sample())
+        return httpx.Response(200, html=UNEMPLOYMENT_PAGE)
+
+    def trends_query(phrases: list[str], timeframe: str) -> DataFrame:
+        time.sleep(latency.sample())
+        dates = date_range(*timeframe.split(), freq="D", name="date")
+        interest = np.random.default_rng(len(dates)).integers(0, 101, size=(len(dates), len(phrases)))
+
+        return DataFrame(interest, index=dates, columns=phrases)
+
+    router.get(url__startswith=app.WEATHER_API_URL).mock(side_effect=delayed(weather))
+    router.get(url__startswith=app.IP_REGISTRY_URL).mock(side_effect=delayed(
+        lambda _: httpx.Response(200, json={"location": {"latitude": 39.46, "longitude": -0.36}})
+    ))
+    router.get(app.LIFE_EXPECTANCY_URL + LifeExpectancyProcessor.ENDPOINT).mock(side_effect=delayed(life_expectancy))
+    router.get(app.UNEMPLOYMENT_URL).mock(side_effect=unemployment)
+    app.trends.query = trends_query
+
+
+async def _timed_requests(client: httpx.AsyncClient, scenario: Callable, requests: int,
+                          concurrency: int) -> tuple[list[float], Counter, float]:
+    latencies, status_codes, semaphore = [], Counter(), asyncio.Semaphore(concurrency)
+
+    async def send():
+        path, params = scenario()
+
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(path, params=params)
+            latencies.append(time.perf_counter() - start)
+            status_codes[response.status_code] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send() for _ in range(requests)))
+
+    return latencies, status_codes, time.perf_counter() - start
+
+
+async def _peak_memory_per_request(client: httpx.AsyncClient, scenario: Callable, requests: int) -> float:
+    """Sends the requests one at a time and returns the mean peak of memory allocated by each one, in bytes"""
+    peaks = []
+    tracemalloc.start()
+
+    for _ in range(requests):
+        path, params = scenario()
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+
+        await client.get(path, params=params)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+
+    tracemalloc.stop()
+    return sum(peaks) / len(peaks)
+
+
+async def benchmark(endpoints: list[str], requests: int, concurrency: int, warmup: int, allocation_requests: int,
+                    latency: Latency) -> dict:
+    scenarios = _scenarios(latency.rng)
+    results = {}
+
+    with respx.mock(assert_all_called=False) as router:
+        mock_upstreams(router, latency)
+        await app.app.router.startup()
+
+        try:
+            async with httpx.AsyncClient(app=app.app, base_url="http://benchmark") as client:
+                for endpoint in endpoints:
+                    scenario = scenarios[endpoint]
+
+                    await _timed_requests(client, scenario, warmup, concurrency)
+                    latencies, status_codes, elapsed = await _timed_requests(client, scenario, requests, concurrency)
+                    peak_memory = await _peak_memory_per_request(client, scenario, allocation_requests)
+
+                    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+                    results[endpoint] = {
+                        "requests": requests,
+                        "status_codes": {str(code): count for code, count in sorted(status_codes.items())},
+                        "p50_ms": round(p50, 3),
+                        "p95_ms": round(p95, 3),
+                        "p99_ms": round(p99, 3),
+                        "throughput_rps": round(requests / elapsed, 1),
+                        "peak_kib_per_request": round(peak_memory / 1024, 1),
+                    }
+                    print(f"{endpoint}: {json.dumps(results[endpoint])}")
+
+                    if success_share(results[endpoint]) < 1:
+                        print(f"WARNING: {endpoint} answered with non-2xx statuses, so its latencies aren't those of "
+                              f"successful requests: {results[endpoint]['status_codes']}", file=sys.stderr)
+        finally:
+            await app.app.router.shutdown()
+
+    return results
+
+
+def success_share(metrics: dict) -> float:
+    """The share of the requests of an endpoint answered with a 2xx status"""
+    status_codes = metrics.get("status_codes", {})
+    total = sum(status_codes.values())
+
+    return sum(count for code, count in status_codes.items() if code.startswith("2")) / total if total else 1.0
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """
+    Returns the metrics of the current results that got worse than the baseline by more than the threshold. Endpoints
+    missing from the current results, or with a lower share of 2xx responses, are regressions too
+    """
+    regressions = []
+
+    for endpoint, baseline_metrics in baseline["endpoints"].items():
+        current_metrics = current["endpoints"].get(endpoint)
+        if current_metrics is None:
+            print(f"{endpoint}: missing from the results REGRESSION")
+            regressions.append(f"{endpoint} missing")
+            continue
+
+        before, after = success_share(baseline_metrics), success_share(current_metrics)
+        is_regression = after < before
+        print(f"{endpoint} 2xx share: {before:.1%} -> {after:.1%}{' REGRESSION' if is_regression else ''}")
+        if is_regression:
+            regressions.append(f"{endpoint} 2xx share")
+
+        for metric, higher_is_worse in METRICS.items():
+            before, after = baseline_metrics[metric], current_metrics[metric]
+            change = (after - before) / before if before else 0.0
+            is_regression = change > threshold if higher_is_worse else change < -threshold
+
+            print(f"{endpoint} {metric}: {before} -> {after} ({change:+.1%}){' REGRESSION' if is_regression else ''}")
+            if is_regression:
+                regressions.append(f"{endpoint} {metric}")
+
+    return regressions
+
+
+def _load(path: str) -> dict:
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def main(arguments: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark.endpoints")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Benchmarks the endpoints and writes the results into a file")
+    run_parser.add_argument("--endpoints", nargs="+", default=list(_scenarios(random.Random())))
+    run_parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    run_parser.add_argument("--concurrency", type=int, default=10, help="Requests sent at the same time")
+    run_parser.add_argument("--warmup", type=int, default=20, help="Requests per endpoint sent before measuring")
+    run_parser.add_argument("--allocation-requests", type=int, default=20,
+                            help="Requests per endpoint traced to measure the memory allocated")
+    run_parser.add_argument("--latency", type=float, default=50, help="Mean latency of the services, in ms")
+    run_parser.add_argument("--jitter", type=float, default=10, help="Standard deviation of the latency, in ms")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default="benchmark-results.json")
+    run_parser.add_argument("--baseline", help="Results to compare with once finished")
+    run_parser.add_argument("--threshold", type=float, default=0.1)
+
+    compare_parser = commands.add_parser("compare", help="Fails if the results got worse than the baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Maximum relative change, e.g. 0.1")
+
+    args = parser.parse_args(arguments)
+
+    if args.command == "run":
+        latency = Latency(args.latency / 1000, args.jitter / 1000, random.Random(args.seed))
+        endpoints = asyncio.run(benchmark(args.endpoints, args.requests, args.concurrency, args.warmup,
+                                          args.allocation_requests, latency))
+        results = {"config": {k: v for k, v in vars(args).items() if k not in ("command", "baseline", "output")},
+                   "endpoints": endpoints}
+
+        with open(args.output, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f"Results written into {args.output}")
+
+        if args.baseline is None:
+            return 0
+        baseline = _load(args.baseline)
+    else:
+        baseline, results = _load(args.baseline), _load(args.results)
+
+    regressions = compare(baseline, results, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} metrics regressed (more than {args.threshold:.0%} for the latency, throughput and "
+              f"memory): {', '.join(regressions)}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
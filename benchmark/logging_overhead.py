@@ -0,0 +1,99 @@
+"""
+Measures the time that logging takes in the thread handling a request, which in the app is the asyncio loop. Each
+request logs a line as the handlers do, comparing the former setup (a stream handler formatting f-strings with the
+path of the source file, as configured by 'logging.basicConfig') with the queue set up by 'setup_logging', with and
+without sampling. Both write into a fast stream and into a slow one, which takes 'slow_write_ms' to write each line.
+Run it from the project root with:
+
+    python -m benchmark.logging_overhead [requests] [slow_write_ms]
+"""
+import io
+import logging
+import random
+import sys
+import time
+from datetime import date
+from typing import Callable
+
+from utils.log_setup import setup_logging, stop_logging, SAMPLED
+
+FORMER_FORMAT = "[%(asctime)s] {%(pathname)s:%(lineno)d} %(levelname)s - %(message)s"
+SAMPLE_RATE = 0.1
+
+
+class SlowStream(io.StringIO):
+
+    def __init__(self, write_seconds: float):
+        super().__init__()
+        self.write_seconds = write_seconds
+
+    def write(self, text: str) -> int:
+        time.sleep(self.write_seconds)
+        return super().write(text)
+
+
+def _former_request(phrase: str, start_date: date, end_date: date):
+    logging.info(f"Retrieving interest for {phrase} between {start_date} and {end_date}")
+
+
+def _lazy_request(phrase: str, start_date: date, end_date: date):
+    logging.info("Retrieving interest for %s between %s and %s", phrase, start_date, end_date)
+
+
+def _sampled_request(phrase: str, start_date: date, end_date: date):
+    token = SAMPLED.set(random.random() < SAMPLE_RATE)
+    try:
+        _lazy_request(phrase, start_date, end_date)
+    finally:
+        SAMPLED.reset(token)
+
+
+def _timed(request: Callable, requests: int) -> float:
+    start = time.perf_counter()
+    for n in range(requests):
+        request(f"phrase {n}", date(2022, 1, 1), date(2022, 1, 15))
+
+    return (time.perf_counter() - start) / requests
+
+
+def _with_former_setup(stream: io.StringIO, requests: int) -> float:
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(FORMER_FORMAT, "%H:%M:%S"))
+    logging.getLogger().addHandler(handler)
+
+    try:
+        return _timed(_former_request, requests)
+    finally:
+        logging.getLogger().removeHandler(handler)
+
+
+def _with_queue(stream: io.StringIO, request: Callable, requests: int) -> tuple[float, float]:
+    """Returns the time per request in the calling thread, and the time per request until every line is written"""
+    setup_logging(stream)
+    start = time.perf_counter()
+
+    per_request = _timed(request, requests)
+    stop_logging()
+
+    return per_request, (time.perf_counter() - start) / requests
+
+
+def main(requests: int, slow_write_ms: float):
+    logging.getLogger().setLevel(logging.INFO)
+
+    streams = {"fast stream": io.StringIO, "slow stream": lambda: SlowStream(slow_write_ms / 1000)}
+    queued_requests = {"queue, lazy arguments": _lazy_request, f"queue, sampled at {SAMPLE_RATE:.0%}": _sampled_request}
+
+    for stream_name, stream_factory in streams.items():
+        print(f"{stream_name}:")
+        print(f"  stream handler, f-string: {_with_former_setup(stream_factory(), requests) * 1_000_000:.1f} µs "
+              f"per request")
+
+        for name, request in queued_requests.items():
+            per_request, until_written = _with_queue(stream_factory(), request, requests)
+            print(f"  {name}: {per_request * 1_000_000:.1f} µs per request "
+                  f"({until_written * 1_000_000:.1f} µs until written)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000, float(sys.argv[2]) if len(sys.argv) > 2 else 0.1)
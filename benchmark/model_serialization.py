@@ -0,0 +1,62 @@
+"""
+Compares serializing the last 7 days of weather and interest as FastAPI did with the dicts returned by
+'TrendsAndWeather.to_json' (through 'jsonable_encoder' and 'JSONResponse') against encoding them straight into bytes,
+both for new days and for days already cached. Reports the time and the peak of memory allocated (traced with
+'tracemalloc') per response. Run it from the project root with:
+
+    python -m benchmark.model_serialization [repetitions]
+"""
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Callable
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from model import TrendsAndWeather, Weather, WeatherDay, PhraseTrends, PhraseTrendDay
+
+DATES = [(date(2022, 4, 15) - timedelta(days=n)).isoformat() for n in range(7)]
+
+
+def _trends_and_weather() -> TrendsAndWeather:
+    weather = Weather([WeatherDay(_, 17.7, 11.7, 14.8, 11.2, 0.7, 80.0, "Light rain shower", 0, "07:29 AM", "08:36 PM")
+                       for _ in DATES])
+    interests = PhraseTrends.of([PhraseTrendDay(_, 100 - n) for n, _ in enumerate(DATES)])
+    return TrendsAndWeather(weather, interests)
+
+
+def _measure(serialize: Callable[[], bytes], repetitions: int) -> tuple[float, int]:
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        serialize()
+    elapsed = (time.perf_counter() - start) / repetitions
+
+    tracemalloc.start()
+    peak = 0
+    for _ in range(min(repetitions, 100)):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        serialize()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main(repetitions: int):
+    cached = _trends_and_weather()
+
+    results = {
+        "dicts": _measure(lambda: JSONResponse(jsonable_encoder(cached.to_json())).body, repetitions),
+        "bytes (new days)": _measure(lambda: _trends_and_weather().to_json_bytes(), repetitions),
+        "bytes (cached days)": _measure(cached.to_json_bytes, repetitions),
+    }
+
+    for name, (elapsed, peak) in results.items():
+        print(f"{name}: {elapsed * 1_000_000:.1f} us and {peak / 1024:.1f} KiB allocated at peak per response")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,42 @@
+"""
+Compares validating US state alpha codes (and getting their names) with the precomputed index against looking them up
+with 'us.states.lookup', which the app used before. Run it from the project root with:
+
+    python -m benchmark.state_validation [repetitions]
+"""
+import sys
+import timeit
+
+import us.states
+
+from model import USState, US_STATE_NAMES, _is_a_us_state
+
+CODES = [*US_STATE_NAMES, "fl", "ny", "XX", "ZZ"]
+
+
+def _lookup(value: str) -> bool:
+    try:
+        return us.states.lookup(value) is not None
+    except Exception:
+        return False
+
+
+def _timed(function, repetitions: int) -> float:
+    elapsed = timeit.timeit(lambda: [function(code) for code in CODES], number=repetitions)
+    return elapsed / (repetitions * len(CODES))
+
+
+def main(repetitions: int):
+    results = {
+        "us.states.lookup (validation)": _timed(_lookup, repetitions),
+        "index (validation)": _timed(_is_a_us_state, repetitions),
+        "us.states.lookup (name)": _timed(lambda _: us.states.lookup(_) and us.states.lookup(_).name, repetitions),
+        "index (name)": _timed(lambda _: _is_a_us_state(_) and USState.of(_), repetitions),
+    }
+
+    for name, elapsed in results.items():
+        print(f"{name}: {elapsed * 1_000_000_000:.0f} ns per code, {1 / elapsed:,.0f} codes per second")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,57 @@
+"""
+Compares parsing the saved BLS page as a whole tree against parsing only its table and update date. Peak memory is
+measured in a new process per parser, as most of it is allocated by libxml2 and is invisible to 'tracemalloc'. As the
+saved page is too small for the peak memory to grow noticeably, its table rows are repeated in that measure. Run it
+from the project root with:
+
+    python -m benchmark.unemployment_parse [repetitions]
+"""
+import resource
+import subprocess
+import sys
+import timeit
+from importlib import resources
+
+from processor import UnemploymentProcessor
+
+PAGE = resources.read_text("test.resources", "unemployment.html")
+PARSERS = {
+    "tree": lambda processor, page: processor.parse_page_tree(page),
+    "table only": lambda processor, page: processor.parse_page_stream(page),
+}
+
+
+ROW_REPETITIONS = 200
+
+
+def peak_memory_kb(parser: str) -> int:
+    """Parses a page with repeated table rows once in this process and returns how much the peak memory grew, in KB"""
+    rows_start, rows_end = PAGE.index("<tbody>") + len("<tbody>"), PAGE.index("</tbody>")
+    page = PAGE[:rows_start] + PAGE[rows_start:rows_end] * ROW_REPETITIONS + PAGE[rows_end:]
+
+    processor = UnemploymentProcessor("http://localhost")
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    PARSERS[parser](processor, page)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+
+
+def main(repetitions: int):
+    processor = UnemploymentProcessor("http://localhost")
+
+    for parser, parse in PARSERS.items():
+        elapsed = timeit.timeit(lambda: parse(processor, PAGE), number=repetitions) / repetitions
+        memory = subprocess.run(
+            [sys.executable, "-W", "ignore", "-m", "benchmark.unemployment_parse", "--memory", parser],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+        print(f"{parser}: {elapsed * 1000:.2f} ms per parse, peak memory grew by {memory} KB "
+              f"(with {ROW_REPETITIONS}x table rows)")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == "--memory":
+        print(peak_memory_kb(sys.argv[2]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
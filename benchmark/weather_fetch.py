@@ -0,0 +1,60 @@
+"""
+Compares fetching the last 7 days of weather one day at a time against fetching them concurrently, using a mocked
+weather API that answers every request after a fixed delay. Run it from the project root with:
+
+    python -m benchmark.weather_fetch [latency_in_ms] [repetitions]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime
+from importlib import resources
+
+import respx
+from httpx import Response
+
+from processor import WeatherProcessor
+
+URL = "http://localhost"
+DAY_XML = resources.read_binary("test.resources.weather", "day_0.xml")
+
+
+async def _fixed_lookup(_: str) -> str:
+    return "39.46,-0.36"
+
+
+async def _timed_get(processor: WeatherProcessor, repetitions: int) -> float:
+    elapsed = 0.0
+    for _ in range(repetitions):
+        processor.cache.clear()
+
+        start = time.perf_counter()
+        await processor.get("", datetime(2022, 4, 15))
+        elapsed += time.perf_counter() - start
+
+    return elapsed / repetitions
+
+
+async def main(latency: float, repetitions: int):
+    async def delayed_response(_):
+        await asyncio.sleep(latency)
+        return Response(200, content=DAY_XML)
+
+    with respx.mock:
+        respx.get(URL + WeatherProcessor.ENDPOINT).mock(side_effect=delayed_response)
+
+        for max_concurrency in (1, WeatherProcessor.DAYS):
+            processor = WeatherProcessor(URL, "", "", max_concurrency=max_concurrency)
+            processor.lookup = _fixed_lookup
+
+            elapsed = await _timed_get(processor, repetitions)
+            print(f"max_concurrency={max_concurrency}: {elapsed * 1000:.1f} ms per request")
+
+            await processor.async_teardown()
+
+
+if __name__ == '__main__':
+    latency_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 100
+    times = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    asyncio.run(main(latency_ms / 1000, times))
@@ -0,0 +1,38 @@
+"""
+Compares parsing the recorded weather API responses from XML against parsing them from JSON, with both the standard
+'json' module and 'orjson' (when installed). Run it from the project root with:
+
+    python -m benchmark.weather_parse [repetitions]
+"""
+import sys
+import timeit
+from importlib import resources
+from unittest import mock
+
+from processor import WeatherProcessor
+from utils import fast_json
+
+DAYS_XML = [resources.read_binary("test.resources.weather", f"day_{n}.xml") for n in range(WeatherProcessor.DAYS)]
+DAYS_JSON = [resources.read_binary("test.resources.weather", f"day_{n}.json") for n in range(WeatherProcessor.DAYS)]
+
+
+def _timed_parse(parse, payloads: list[bytes], repetitions: int) -> float:
+    elapsed = timeit.timeit(lambda: [parse("2022-04-15", payload) for payload in payloads], number=repetitions)
+    return elapsed / (repetitions * len(payloads))
+
+
+def main(repetitions: int):
+    results = {"xml": _timed_parse(WeatherProcessor.parse, DAYS_XML, repetitions)}
+
+    with mock.patch.object(fast_json, "orjson", None):
+        results["json"] = _timed_parse(WeatherProcessor.parse_json, DAYS_JSON, repetitions)
+
+    if fast_json.orjson is not None:
+        results["json (orjson)"] = _timed_parse(WeatherProcessor.parse_json, DAYS_JSON, repetitions)
+
+    for name, elapsed in results.items():
+        print(f"{name}: {elapsed * 1_000_000:.1f} us per day")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
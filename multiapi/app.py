@@ -4,22 +4,94 @@ from datetime import date, datetime, timedelta
 
 from decouple import config
 from fastapi import FastAPI
-from fastapi import Request
-from fastapi.responses import JSONResponse
-
-from utils import setup_logging, setup_openapi
-from model import SexType, RaceType, USState, AppException, TrendsAndWeather
-from processor import UnemploymentProcessor, LifeExpectancyProcessor, TrendsProcessor, WeatherProcessor
+from fastapi import Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from utils import setup_logging, setup_openapi, metrics
+from utils.log_setup import RequestContextMiddleware, parse_sample_rates
+from utils.concurrency import gather_or_cancel
+from utils.upstream import UpstreamClients
+from utils.watchdog import LoopWatchdog
+from model import SexType, RaceType, USState, AppException, TrendsAndWeather, UnemploymentRate, PhraseTrends, \
+    TrendsPeriod
+from processor import UnemploymentProcessor, LifeExpectancyProcessor, TrendsProcessor, WeatherProcessor, \
+    IpLocationProcessor
 
 setup_logging()
 
-weather = WeatherProcessor("http://api.weatherapi.com/v1", config("IP_REGISTRY_KEY", ""), config("WEATHER_API_KEY", ""))
-unemployment = UnemploymentProcessor("https://www.bls.gov/web/laus/lauhsthl.htm")
-trends = TrendsProcessor()
-life_expectancy = LifeExpectancyProcessor("https://data.cdc.gov")
-
-app = FastAPI()
+WEATHER_API_URL = config("WEATHER_API_URL", "http://api.weatherapi.com/v1")
+IP_REGISTRY_URL = config("IP_REGISTRY_URL", "https://api.ipregistry.co")
+UNEMPLOYMENT_URL = config("UNEMPLOYMENT_URL", "https://www.bls.gov/web/laus/lauhsthl.htm")
+LIFE_EXPECTANCY_URL = config("LIFE_EXPECTANCY_URL", "https://data.cdc.gov")
+TRENDS_URL = config("TRENDS_URL", None)
+
+upstreams = UpstreamClients()
+upstreams.register("weatherapi", WEATHER_API_URL)
+upstreams.register("ipregistry", IP_REGISTRY_URL)
+upstreams.register("bls", UNEMPLOYMENT_URL)
+upstreams.register("cdc", LIFE_EXPECTANCY_URL)
+
+ip_location = IpLocationProcessor(
+    IP_REGISTRY_URL,
+    config("IP_REGISTRY_KEY", ""),
+    cache_size=config("IP_LOCATION_CACHE_SIZE", 10_000, cast=int),
+    ttl=config("IP_LOCATION_TTL", 3600, cast=float),
+    share_prefix=config("IP_LOCATION_SHARE_PREFIX", False, cast=bool),
+    client=upstreams.async_client("ipregistry"),
+    resilience=upstreams.resilience("ipregistry")
+)
+weather = WeatherProcessor(
+    WEATHER_API_URL,
+    config("IP_REGISTRY_KEY", ""),
+    config("WEATHER_API_KEY", ""),
+    max_concurrency=config("WEATHER_MAX_CONCURRENCY", 7, cast=int),
+    cache_size=config("WEATHER_CACHE_SIZE", 10_000, cast=int),
+    today_ttl=config("WEATHER_TODAY_TTL", 600, cast=float),
+    ip_location=ip_location,
+    client=upstreams.async_client("weatherapi"),
+    use_json=config("WEATHER_USE_JSON", False, cast=bool),
+    resilience=upstreams.resilience("weatherapi")
+)
+unemployment = UnemploymentProcessor(
+    UNEMPLOYMENT_URL,
+    snapshot_path=config("UNEMPLOYMENT_SNAPSHOT_PATH", None),
+    snapshot_timeout=config("UNEMPLOYMENT_SNAPSHOT_TIMEOUT", 10, cast=float),
+    retry_interval=config("UNEMPLOYMENT_RETRY_INTERVAL", 60, cast=float),
+    client=upstreams.client("bls")
+)
+trends = TrendsProcessor(
+    max_workers=config("TRENDS_MAX_WORKERS", 4, cast=int),
+    pool_size=config("TRENDS_POOL_SIZE", None, cast=lambda _: int(_) if _ else None),
+    batch_window=config("TRENDS_BATCH_WINDOW", 0, cast=float),
+    cache_size=config("TRENDS_CACHE_SIZE", 1000, cast=int),
+    url=TRENDS_URL
+)
+life_expectancy = LifeExpectancyProcessor(
+    LIFE_EXPECTANCY_URL,
+    preload=config("LIFE_EXPECTANCY_PRELOAD", False, cast=bool),
+    refresh_interval=config("LIFE_EXPECTANCY_REFRESH_INTERVAL", 86400, cast=float),
+    client=upstreams.async_client("cdc"),
+    resilience=upstreams.resilience("cdc")
+)
+
+app = FastAPI(
+    default_response_class=ORJSONResponse if config("ORJSON_RESPONSES", False, cast=bool) else JSONResponse
+)
 app.openapi = setup_openapi(app)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(
+    RequestContextMiddleware,
+    sample_rates=config("LOG_SAMPLE_RATES", "", cast=parse_sample_rates),
+    default_sample_rate=config("LOG_SAMPLE_RATE", 1.0, cast=float)
+)
+
+runtime_monitor = metrics.RuntimeMonitor(
+    interval=config("METRICS_SAMPLE_INTERVAL", 0.5, cast=float),
+    executors={"trends": trends.executor}
+)
+loop_watchdog_threshold = config("LOOP_WATCHDOG_THRESHOLD_MS", 0, cast=float)
+loop_watchdog = LoopWatchdog(loop_watchdog_threshold / 1000, app.routes) if loop_watchdog_threshold > 0 else None
 
 
 def get_client_ip(request: Request) -> str:
@@ -35,56 +107,96 @@ async def health_handler():
 
 @app.get("/life_expectancy/{sex}/{race}/{year}")
 async def life_expectancy_handler(sex: SexType, race: RaceType, year: int):
-    logging.info(f"Retrieving life expectancy for {race} {sex} in {year}")
+    logging.info("Retrieving life expectancy for %s %s in %s", race, sex, year)
     result = await life_expectancy.get(sex, race, year)
     return result
 
 
-@app.get("/unemployment/{state}")
+@app.get("/unemployment/{state}", response_model=UnemploymentRate)
 def unemployment_rate_handler(state: USState):
     state_name = USState.of(state)
-    logging.info(f"Retrieving unemployment rate in {state_name} (last updated in {unemployment.last_update_date})")
-    return unemployment.get(state)
+    logging.info("Retrieving unemployment rate in %s (last updated in %s)", state_name, unemployment.last_update_date)
+
+    body = unemployment.get_json(state)
+    headers = {"Warning": '110 - "Response is Stale"'} if unemployment.is_stale else None
+
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @app.get("/trends")
-def trends_interest_handler(phrase: str, start_date: Optional[date] = None, end_date: Optional[date] = None):
+async def trends_interest_handler(phrase: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                                  resample: Optional[TrendsPeriod] = None, rolling: Optional[int] = Query(None, ge=1),
+                                  agg: Optional[str] = Query(None, regex=PhraseTrends.AGGREGATE_PATTERN)):
     """
     :param phrase: A sentence to look into Google Trends
     :param start_date: A date with the format YYYY-mm-dd
     :param end_date: A date with the format YYYY-mm-dd
+    :param resample: Averages the interest of each week or month. The dates of the interest are returned too
+    :param rolling: Averages the interest over windows of this number of values. The dates of the interest are
+    returned too
+    :param agg: Reduces the interest to a single value: mean, median, min, max or a percentile such as p95
     """
 
     if start_date is None or end_date is None:
         _end_date = datetime.now()
         _start_date = _end_date - timedelta(weeks=2)
 
-        logging.info(f"Retrieving interest for {phrase} between {_start_date} and {_end_date}")
-        return trends.get(phrase, _start_date, _end_date).to_json()
+        logging.info("Retrieving interest for %s between %s and %s", phrase, _start_date, _end_date)
+        result = await trends.async_get(phrase, _start_date, _end_date)
     else:
-        logging.info(f"Retrieving interest for {phrase} between {start_date} and {end_date}")
-        return trends.get(phrase, start_date, end_date).to_json()
+        logging.info("Retrieving interest for %s between %s and %s", phrase, start_date, end_date)
+        result = await trends.async_get(phrase, start_date, end_date)
+
+    if resample is not None:
+        result = result.resample(resample)
+    if rolling is not None:
+        result = result.rolling(rolling)
+    if agg is not None:
+        return {agg: result.aggregate(agg)}
+
+    return result.to_json(with_dates=resample is not None or rolling is not None)
 
 
 @app.get("/trends_weather")
 async def weather_and_trends_for_last_7_days_handler(phrase: str, request: Request):
-    logging.info(f"Retrieving weather and interest for {phrase} in the last 7 days")
+    logging.info("Retrieving weather and interest for %s in the last 7 days", phrase)
 
     _end_date = datetime.now()
     client_ip = get_client_ip(request)
 
-    trends_result = trends.get(phrase, _end_date - timedelta(weeks=1), _end_date)
-    weather_result = await weather.get(client_ip)
-    return TrendsAndWeather(weather_result, trends_result).to_json()
+    trends_result, weather_result = await gather_or_cancel([
+        trends.async_get(phrase, _end_date - timedelta(weeks=1), _end_date),
+        weather.get(client_ip)
+    ])
+    return Response(TrendsAndWeather(weather_result, trends_result).to_json_bytes(), media_type="application/json")
 
 
 @app.get("/weather")
 async def weather_for_last_7_days_handler(request: Request):
-    logging.info(f"Retrieving weather data for the last 7 days")
+    logging.info("Retrieving weather data for the last 7 days")
 
     client_ip = get_client_ip(request)
     response = await weather.get(client_ip)
-    return response.items()
+    return Response(response.to_json_bytes(), media_type="application/json")
+
+
+@app.get("/stats")
+async def stats_handler():
+    """Exposes the counters of the caches and pools, which helps to size them"""
+    return {
+        "weather_days_cache": weather.cache.stats().to_json(),
+        "ip_location_cache": ip_location.cache.stats().to_json(),
+        "trends_session_pool": trends.pool.stats().to_json(),
+        "trends_days_cache": trends.cache.stats().to_json() if trends.cache is not None else None,
+        "upstream_connections": {name: stats.to_json() for name, stats in upstreams.stats().items()}
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_handler():
+    """Exposes the metrics in the Prometheus text format, aggregated across the workers"""
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
 
 
 @app.exception_handler(AppException)
@@ -92,7 +204,23 @@ async def app_exception_handler(_: Request, exc: AppException):
     return JSONResponse(status_code=exc.status, content={"message": exc.message})
 
 
+@app.on_event("startup")
+async def on_startup():
+    await run_in_threadpool(unemployment.setup)
+    await life_expectancy.async_setup()
+    runtime_monitor.start()
+    if loop_watchdog is not None:
+        loop_watchdog.start()
+
+
 @app.on_event("shutdown")
 async def on_shutdown():
+    unemployment.teardown()
+    trends.teardown()
     await weather.async_teardown()
     await life_expectancy.async_teardown()
+    await upstreams.aclose()
+    await runtime_monitor.stop()
+    if loop_watchdog is not None:
+        loop_watchdog.stop()
+    metrics.mark_process_dead()
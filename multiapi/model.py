@@ -1,21 +1,36 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import itertools
+from dataclasses import dataclass, field
+from datetime import date
 from enum import Enum
+from types import MappingProxyType
+from typing import Iterable, Iterator, Optional
 
+import numpy as np
 import us.states
+from pandas import Series
 from phantom import Phantom
 from phantom.schema import Schema
 
+from utils.fast_json import dumps
+
+
+_EPOCH = date(1970, 1, 1)
+
+US_STATE_NAMES = MappingProxyType({
+    state.abbr: state.name for state in itertools.chain(us.states.STATES_AND_TERRITORIES, [us.states.DC],
+                                                        us.states.OBSOLETE)
+})
+"""Maps the alpha code of every US state and territory to its name"""
+
+US_STATE_CODES = MappingProxyType({name: abbr for abbr, name in US_STATE_NAMES.items()})
+"""Maps the name of every US state and territory to its alpha code"""
+
 
 def _is_a_us_state(value: str) -> bool:
     """Checks if a string is a valid US state alpha code. Examples: FL, NY, MA"""
-    if len(value) == 2:
-        try:
-            return us.states.lookup(value) is not None
-        except:
-            pass
-    return False
+    return isinstance(value, str) and value.upper() in US_STATE_NAMES
 
 
 class SexType(str, Enum):
@@ -28,6 +43,11 @@ class SexType(str, Enum):
         return " ".join(_.capitalize() for _ in self.value.split("-"))
 
 
+class TrendsPeriod(str, Enum):
+    week = "week"
+    month = "month"
+
+
 class RaceType(str, Enum):
     """These groups are mutually exclusive"""
     white = "white"
@@ -51,34 +71,99 @@ class USState(str, Phantom, predicate=_is_a_us_state):
 
     @staticmethod
     def of(value: str) -> str:
-        return us.states.lookup(value).name
+        """Returns the name of the state"""
+        return US_STATE_NAMES[value.upper()]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LifeExpectancy:
     average_life_expectancy: float
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class UnemploymentRate:
     rate: float
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PhraseTrendDay:
     date: str
     interest: float
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, eq=False)
 class PhraseTrends:
-    trends: list[PhraseTrendDay]
+    """The interest of a phrase over time, kept as two columns: the dates (in days) and their interest"""
+    dates: np.ndarray
+    interest: np.ndarray
 
-    def to_json(self):
-        return {"interest": [_.interest for _ in self.trends]}
+    AGGREGATE_PATTERN = r"^(mean|median|min|max|p(100(\.0+)?|[1-9]?[0-9](\.[0-9]+)?))$"
 
+    @classmethod
+    def of(cls, trends: Iterable[PhraseTrendDay]) -> PhraseTrends:
+        trends = list(trends)
+        return cls(np.array([_.date for _ in trends], dtype="datetime64[D]"), np.array([_.interest for _ in trends]))
 
-@dataclass
+    @classmethod
+    def from_series(cls, interest: Series) -> PhraseTrends:
+        """Builds the columns from a series of interest indexed by date, without copying the interest"""
+        return cls(np.asarray(interest.index.values).astype("datetime64[D]"), interest.to_numpy())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PhraseTrends):
+            return NotImplemented
+
+        return np.array_equal(self.dates, other.dates) and np.array_equal(self.interest, other.interest)
+
+    def date_strings(self) -> np.ndarray:
+        return np.datetime_as_string(self.dates, unit="D")
+
+    def resample(self, period: TrendsPeriod) -> PhraseTrends:
+        """Averages the interest of each week (starting on Monday) or month, which are dated by their first day"""
+        if period == TrendsPeriod.week:
+            # The epoch, from which weekdays are counted, was a Thursday
+            periods = self.dates - (self.dates.astype(np.int64) + 3) % 7
+        else:
+            periods = self.dates.astype("datetime64[M]").astype("datetime64[D]")
+
+        period_dates, day_periods = np.unique(periods, return_inverse=True)
+        interest_sums = np.bincount(day_periods, weights=self.interest, minlength=len(period_dates))
+        days = np.bincount(day_periods, minlength=len(period_dates))
+
+        return PhraseTrends(period_dates, np.round(interest_sums / np.maximum(days, 1), 2))
+
+    def rolling(self, window: int) -> PhraseTrends:
+        """Averages the interest of every 'window' consecutive values, which are dated by the last one"""
+        if window > len(self.interest):
+            return PhraseTrends(self.dates[:0], self.interest[:0].astype(float))
+
+        interest_sums = np.cumsum(np.concatenate(([0.0], self.interest)))
+        window_means = (interest_sums[window:] - interest_sums[:-window]) / window
+
+        return PhraseTrends(self.dates[window - 1:], np.round(window_means, 2))
+
+    def aggregate(self, function: str) -> Optional[float]:
+        """
+        Reduces the interest to a single value
+
+        :param function: One of 'mean', 'median', 'min', 'max' or a percentile such as 'p95'
+        """
+        if not len(self.interest):
+            return None
+
+        if function.startswith("p"):
+            return round(float(np.percentile(self.interest, float(function[1:]))), 2)
+
+        return round(float(getattr(np, function)(self.interest)), 2)
+
+    def to_json(self, with_dates: bool = False):
+        if with_dates:
+            return {"dates": self.date_strings().tolist(), "interest": self.interest.tolist()}
+
+        return {"interest": self.interest.tolist()}
+
+
+@dataclass(frozen=True, slots=True)
 class WeatherDay:
     date: str
     max_temperature_celsius: float
@@ -91,6 +176,7 @@ class WeatherDay:
     uv_index: int
     sunrise: str
     sunset: str
+    _json_fields: Optional[bytes] = field(default=None, init=False, repr=False, compare=False)
 
     def to_json(self):
         return {
@@ -107,29 +193,80 @@ class WeatherDay:
             "sunset": self.sunset
         }
 
+    def json_fields(self) -> bytes:
+        """
+        Returns the weather data (i.e. everything but the date) encoded as the members of a JSON object, without the
+        braces. They're only formatted the first time, so days kept in a cache are never formatted again
+        """
+        if self._json_fields is None:
+            weather_data = self.to_json()
+            del weather_data["date"]
+            object.__setattr__(self, "_json_fields", dumps(weather_data)[1:-1])
 
-@dataclass
+        return self._json_fields
+
+    def to_json_bytes(self) -> bytes:
+        return b'{"date":' + dumps(self.date) + b"," + self.json_fields() + b"}"
+
+
+@dataclass(frozen=True, slots=True)
 class Weather:
-    dates: list[WeatherDay]
+    dates: tuple[WeatherDay, ...]
+
+    def __post_init__(self):
+        object.__setattr__(self, "dates", tuple(self.dates))
 
     def items(self) -> list:
         """Returns a list of weather data for each day"""
         return [date.to_json() for date in self.dates]
 
+    def to_json_bytes(self) -> bytes:
+        """Same as 'items', but encoded as JSON"""
+        return b"[" + b",".join(date.to_json_bytes() for date in self.dates) + b"]"
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class TrendsAndWeather:
     weather: Weather
     interests: PhraseTrends
 
+    def rows(self) -> Iterator[tuple[WeatherDay, float]]:
+        """Joins the weather and interest of each day. Days without interest data are left out"""
+        interests = dict(zip(self.interests.dates.astype(np.int64).tolist(), self.interests.interest.tolist()))
+
+        for weather_day in self.weather.dates:
+            day = (date.fromisoformat(weather_day.date) - _EPOCH).days
+            if day in interests:
+                yield weather_day, interests[day]
+
     def to_json(self) -> list:
         result = []
-        for (interests, weather_data) in zip(self.interests.trends, self.weather.items()):
-            date = weather_data.pop("date")
-            result.append({"date": date, "interest": interests.interest, "weather": weather_data})
+
+        for weather_day, interest in self.rows():
+            weather_data = weather_day.to_json()
+            del weather_data["date"]
+            result.append({"date": weather_day.date, "interest": interest, "weather": weather_data})
 
         return result
 
+    def iter_json(self) -> Iterator[bytes]:
+        """
+        Same as 'to_json', but yields the JSON encoding in chunks. Every day is written straight from the weather data
+        already encoded (see 'WeatherDay.json_fields'), without building any dict
+        """
+        yield b"["
+
+        for n, (weather_day, interest) in enumerate(self.rows()):
+            yield (b',{"date":' if n else b'{"date":') + dumps(weather_day.date)
+            yield b',"interest":' + dumps(interest) + b',"weather":{'
+            yield weather_day.json_fields()
+            yield b"}}"
+
+        yield b"]"
+
+    def to_json_bytes(self) -> bytes:
+        return b"".join(self.iter_json())
+
 
 @dataclass
 class AppException(Exception):
@@ -2,4 +2,5 @@ from .unemployment import UnemploymentProcessor
 from .life_expectancy import LifeExpectancyProcessor
 from .trends import TrendsProcessor
 from .weather import WeatherProcessor
+from .ip_location import IpLocationProcessor
 
@@ -1,6 +1,8 @@
+import asyncio
+import functools
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import TypeVar, Generic, Any, Optional
+from typing import TypeVar, Generic, Any, Optional, Hashable, Callable, Awaitable
 
 T = TypeVar("T")
 
@@ -18,6 +20,14 @@ class BaseProcessor(Generic[T], ABC):
     def __post_init__(self):
         self.store = self.parse()
 
+    def setup(self):
+        """Utility method that gets called upon the app's start"""
+        ...
+
+    def teardown(self):
+        """Utility method that gets called upon the app's shutdown"""
+        ...
+
     @abstractmethod
     def get(self, *_) -> T:
         ...
@@ -27,11 +37,33 @@ class BaseProcessor(Generic[T], ABC):
         return None
 
 
+class _Flight:
+    """A call shared by all the concurrent callers with the same key"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
 @dataclass
 class AsyncBaseProcessor(Generic[T], ABC):
-    """A parser that can asynchronously extract and process data from an external service"""
+    """
+    A parser that can asynchronously extract and process data from an external service.
+
+    Concurrent calls to 'get' with the same arguments can be coalesced into a single one by overriding 'flight_key'
+    """
     url: Optional[str]
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if "get" in cls.__dict__:
+            cls.get = _single_flight(cls.__dict__["get"])
+
+    async def async_setup(self):
+        """Utility method that gets called in the asyncio loop upon the app's start"""
+        ...
+
     async def async_teardown(self):
         """Utility method that gets called in the asyncio loop upon the app's shutdown"""
         ...
@@ -39,3 +71,46 @@ class AsyncBaseProcessor(Generic[T], ABC):
     @abstractmethod
     async def get(self, *_) -> T:
         ...
+
+    def flight_key(self, *_, **__) -> Optional[Hashable]:
+        """
+        Returns the key that identifies the result of 'get' for the given arguments. Concurrent calls with the same key
+        share a single call. If None, the call is not shared
+        """
+        return None
+
+    async def coalesce(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs the call, unless there is one with the same key in flight already, in which case its result is awaited.
+        The shared call only gets cancelled when all of its callers are cancelled
+        """
+        flights: dict[Hashable, _Flight] = self.__dict__.setdefault("_flights", {})
+        flight = flights.get(key)
+
+        if flight is None:
+            flight = flights[key] = _Flight(asyncio.ensure_future(call()))
+            flight.task.add_done_callback(lambda _: flights.pop(key) if flights.get(key) is flight else None)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flights.pop(key, None)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+
+def _single_flight(get: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    @functools.wraps(get)
+    async def single_flight_get(self: AsyncBaseProcessor, *args, **kwargs) -> T:
+        key = self.flight_key(*args, **kwargs)
+
+        if key is None:
+            return await get(self, *args, **kwargs)
+
+        return await self.coalesce(key, lambda: get(self, *args, **kwargs))
+
+    return single_flight_get
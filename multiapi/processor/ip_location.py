@@ -0,0 +1,76 @@
+from ipaddress import ip_address, ip_network
+from typing import Optional
+
+import httpx
+
+from .base import AsyncBaseProcessor
+from utils.cache import LRUCache
+from utils.resilience import Resilience
+
+
+class IpLocationProcessor(AsyncBaseProcessor[str]):
+    """Resolves an IP address into its coordinates, using the Ipregistry API"""
+
+    IPV4_PREFIX = 24
+    IPV6_PREFIX = 48
+
+    def __init__(self, url: str, api_key: str, cache_size: int = 10_000, ttl: float = 3600,
+                 share_prefix: bool = False, client: Optional[httpx.AsyncClient] = None,
+                 resilience: Optional[Resilience] = None):
+        """
+        :param url: The base URL of the Ipregistry API
+        :param api_key: The Ipregistry API key
+        :param cache_size: The maximum number of locations kept in the cache
+        :param ttl: The number of seconds a location is cached for
+        :param share_prefix: If True, IPs in the same /24 (IPv4) or /48 (IPv6) network share the cached location
+        :param client: The HTTP client to call the service with. By default, the processor builds (and closes) its own
+        :param resilience: Guards the requests to the Ipregistry API. When they fail fast, or miss their deadline, the
+        expired location in the cache is returned, if any
+        """
+        self.url = url
+        self.client = client or httpx.AsyncClient(base_url=url)
+        self.owns_client = client is None
+        self.api_key = api_key
+
+        self.cache: LRUCache[str, str] = LRUCache(cache_size, ttl=ttl)
+        self.share_prefix = share_prefix
+        self.resilience = resilience or Resilience("ipregistry")
+
+    async def async_teardown(self):
+        if self.owns_client:
+            await self.client.aclose()
+
+    async def get(self, client_ip: str) -> str:
+        """
+        Returns the location of the IP formatted as 'latitude,longitude'. An empty IP looks up the location of this
+        service. Concurrent lookups that share the cache key wait for the same request
+        """
+        key = self.cache_key(client_ip)
+        location = self.cache.get(key)
+
+        if location is not None:
+            return location
+
+        return await self.coalesce(key, lambda: self.resilience.call(
+            lambda: self.fetch(key, client_ip), lambda: self.cache.get(key, stale=True)
+        ))
+
+    async def fetch(self, key: str, client_ip: str) -> str:
+        response = await self.client.get(f"/{client_ip}", params={"key": self.api_key})
+        response.raise_for_status()
+
+        ip_location = response.json()["location"]
+        location = f"{ip_location['latitude']},{ip_location['longitude']}"
+
+        self.cache.set(key, location)
+        return location
+
+    def cache_key(self, client_ip: str) -> str:
+        if not self.share_prefix or not client_ip:
+            return client_ip
+
+        try:
+            prefix = self.IPV4_PREFIX if ip_address(client_ip).version == 4 else self.IPV6_PREFIX
+            return str(ip_network(f"{client_ip}/{prefix}", strict=False))
+        except ValueError:
+            return client_ip
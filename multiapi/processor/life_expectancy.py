@@ -1,21 +1,64 @@
+import asyncio
+import logging
+from typing import Optional
+
 import httpx
 
-from model import LifeExpectancy, SexType, RaceType
+from model import LifeExpectancy, SexType, RaceType, AppException
 from .base import AsyncBaseProcessor
+from utils.resilience import Resilience
 
 
 class LifeExpectancyProcessor(AsyncBaseProcessor[LifeExpectancy]):
 
     ENDPOINT = "/resource/w9j2-ggv5.json"
+    DATASET_LIMIT = 50_000
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, preload: bool = False, refresh_interval: float = 86400,
+                 client: Optional[httpx.AsyncClient] = None, resilience: Optional[Resilience] = None):
+        """
+        :param url: The base URL of the CDC API
+        :param preload: If True, the whole dataset is downloaded upon the app's start and kept in memory, so that
+        requests are answered without querying the CDC API. Queries not found in memory are still sent to the API
+        :param refresh_interval: The number of seconds to wait until the preloaded dataset is downloaded again
+        :param client: The HTTP client to call the service with. By default, the processor builds (and closes) its own
+        :param resilience: Guards the queries sent to the CDC API (but not the downloads of the whole dataset)
+        """
         self.url = url
-        self.client = httpx.AsyncClient(base_url=url)
+        self.client = client or httpx.AsyncClient(base_url=url)
+        self.owns_client = client is None
+
+        self.preload = preload
+        self.refresh_interval = refresh_interval
+        self.index: dict[tuple[str, str, int], float] = {}
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.resilience = resilience or Resilience("cdc")
+
+    async def async_setup(self):
+        if self.preload:
+            await self.refresh()
+            self.refresh_task = asyncio.create_task(self.refresh_periodically())
 
     async def async_teardown(self):
-        await self.client.aclose()
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+
+        if self.owns_client:
+            await self.client.aclose()
+
+    def flight_key(self, sex: SexType, race: RaceType, year: int) -> Optional[tuple]:
+        key = (sex.name, race.name, year)
+        return key if key not in self.index else None
 
     async def get(self, sex: SexType, race: RaceType, year: int) -> LifeExpectancy:
+        average_life_expectancy = self.index.get((sex.name, race.name, year))
+
+        if average_life_expectancy is not None:
+            return LifeExpectancy(average_life_expectancy)
+
+        return await self.resilience.call(lambda: self.fetch(sex, race, year))
+
+    async def fetch(self, sex: SexType, race: RaceType, year: int) -> LifeExpectancy:
         query_parameters = {
             "sex": sex.name,
             "race": race.name,
@@ -26,4 +69,31 @@ class LifeExpectancyProcessor(AsyncBaseProcessor[LifeExpectancy]):
         response.raise_for_status()
 
         data = response.json()
+        if not data:
+            raise AppException(f"No life expectancy data for {sex.name} {race.name} people in {year}", 404)
+
         return LifeExpectancy(float(data[0]["average_life_expectancy"]))
+
+    async def refresh(self):
+        """Downloads the whole dataset and replaces the in-memory index. On failure, the current index is kept"""
+        try:
+            query_parameters = {"$select": "sex,race,year,average_life_expectancy", "$limit": self.DATASET_LIMIT}
+
+            response = await self.client.get(self.ENDPOINT, params=query_parameters)
+            response.raise_for_status()
+
+            self.index = self.build_index(response.json())
+        except Exception as e:
+            logging.warning("Unable to preload the life expectancy dataset: %s", e)
+
+    async def refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    @staticmethod
+    def build_index(rows: list[dict]) -> dict[tuple[str, str, int], float]:
+        return {
+            (row["sex"], row["race"], int(row["year"])): float(row["average_life_expectancy"])
+            for row in rows if row.get("average_life_expectancy") is not None
+        }
@@ -1,27 +1,101 @@
-from datetime import datetime
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import partial
 from typing import Optional
 
-from pytrends.request import TrendReq
+import requests
+from pandas import DataFrame, Series
+from pytrends.request import TrendReq, BASE_TRENDS_URL
 
-from model import PhraseTrends, PhraseTrendDay
+from model import PhraseTrends
 from .base import BaseProcessor
+from .trends_batch import TrendsBatcher
+from .trends_cache import TrendsDayCache
+from .trends_pool import TrendReqPool
 from utils.datetime import query_format
+from utils.metrics import UpstreamTimer
+
+
+class RedirectedTrendReq(TrendReq):
+    """
+    A Google Trends session that sends its requests to another base URL, such as a local stub of Google Trends.
+    'TrendReq' builds its URLs from a module constant, so they are rewritten right before each request is sent
+    """
+
+    def __init__(self, base_url: str, *args, **kwargs):
+        self.base_url = base_url.rstrip("/")
+        super().__init__(*args, **kwargs)
+
+    def GetGoogleCookie(self):
+        response = requests.get(f"{self.base_url}/?geo={self.hl[-2:]}", timeout=self.timeout, **self.requests_args)
+        return {name: value for name, value in response.cookies.items() if name == "NID"}
+
+    def _get_data(self, url, *args, **kwargs):
+        return super()._get_data(url.replace(BASE_TRENDS_URL, self.base_url, 1), *args, **kwargs)
 
 
 class TrendsProcessor(BaseProcessor[PhraseTrends]):
 
-    def __init__(self, trends_api: Optional[TrendReq] = None):
-        self.url, self.store = None, None
-        self.search_tool = trends_api or TrendReq()
+    def __init__(self, trends_api: Optional[TrendReq] = None, max_workers: int = 4, pool_size: Optional[int] = None,
+                 max_failures: int = 3, batch_window: float = 0, cache_size: int = 0, url: Optional[str] = None):
+        """
+        :param trends_api: A Google Trends client to use as the only session. By default, a pool of new sessions is used
+        :param max_workers: The maximum number of threads running Google Trends queries when called from the asyncio
+        loop (see 'async_get')
+        :param pool_size: The maximum number of Google Trends sessions. By default, one per thread
+        :param max_failures: The number of consecutive failures after which a session is replaced by a new one
+        :param batch_window: If greater than 0, concurrent queries for the same dates are sent together in a single
+        Google Trends query, waiting up to this number of seconds for other queries to join (see 'TrendsBatcher')
+        :param cache_size: If greater than 0, the daily interest of up to this number of phrases is cached, so that only
+        the days not cached yet are queried (see 'TrendsDayCache')
+        :param url: The base URL of Google Trends, such as 'https://trends.google.com/trends'. By default, the one of
+        'pytrends' is used
+        """
+        self.url, self.store = url, None
+        session_factory = partial(RedirectedTrendReq, url) if url is not None else TrendReq
+        self.pool = TrendReqPool(1, lambda: trends_api, max_failures) if trends_api is not None \
+            else TrendReqPool(pool_size or max_workers, session_factory, max_failures)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="trends")
+        self.batcher = TrendsBatcher(self.query, batch_window) if batch_window > 0 else None
+        self.cache = TrendsDayCache(self.fetch, cache_size) if cache_size > 0 else None
+
+    def teardown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
     def get(self, phrase: str, start_date: datetime, end_date: datetime) -> PhraseTrends:
+        if self.cache is not None:
+            data = self.cache.get(phrase, start_date, end_date)
+        else:
+            data = self.fetch(phrase, start_date, end_date)
+
+        return PhraseTrends.from_series(data)
+
+    def fetch(self, phrase: str, start_date: date, end_date: date) -> Series:
+        """Queries the interest over time of the phrase, indexed by date"""
         timeframe = f"{query_format(start_date)} {query_format(end_date)}"
 
-        self.search_tool.build_payload(kw_list=[phrase], timeframe=timeframe)
-        data = self.search_tool.interest_over_time().iloc[:, :1]
+        if self.batcher is not None:
+            return self.batcher.get(phrase, timeframe)
+
+        interests = self.query([phrase], timeframe)
+        return interests[phrase] if phrase in interests else Series(dtype=int)
+
+    def query(self, phrases: list[str], timeframe: str) -> DataFrame:
+        """Queries the interest over time of the phrases, with one column per phrase"""
+        with self.pool.session() as search_tool, UpstreamTimer("trends") as timer:
+            search_tool.build_payload(kw_list=phrases, timeframe=timeframe)
+            interests = search_tool.interest_over_time()
+            timer.status = "200"
 
-        return PhraseTrends(
-            [PhraseTrendDay(query_format(date), value[0])
-             for (date, value) in zip(data.index.tolist(), data.values.tolist())]
-        )
+        return interests
 
+    async def async_get(self, phrase: str, start_date: datetime, end_date: datetime) -> PhraseTrends:
+        """
+        Runs 'get' in the processor's own thread pool, so that it doesn't block the asyncio loop. It runs in a copy of
+        the caller's context, which keeps the ID of the request in its logs
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, context.run, self.get, phrase, start_date, end_date)
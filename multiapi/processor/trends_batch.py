@@ -0,0 +1,89 @@
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable
+
+from pandas import DataFrame, Series
+
+
+@dataclass
+class _Batch:
+    timeframe: str
+    futures: dict[str, Future] = field(default_factory=dict)
+    full: threading.Event = field(default_factory=threading.Event)
+
+
+class TrendsBatcher:
+    """
+    Groups the concurrent queries for the same timeframe into a single Google Trends query with several keywords.
+    The first caller of a batch waits for a short window (or until the batch is full), sends the query and hands each
+    phrase's interest back to its callers.
+
+    Google Trends normalizes the interest of all the keywords in a query together, so that the highest value among
+    them is 100. Each column is re-scaled so that its own maximum is 100, which is what a single-keyword query returns
+    (up to rounding). Note that phrases much less popular than the rest of the batch lose precision
+    """
+
+    MAX_KEYWORDS = 5
+
+    def __init__(self, query: Callable[[list[str], str], DataFrame], window: float = 0.05,
+                 max_phrases: int = MAX_KEYWORDS):
+        """
+        :param query: A function that queries Google Trends for a list of phrases and a timeframe
+        :param window: The number of seconds to wait for other phrases before sending a query
+        :param max_phrases: The maximum number of phrases per query
+        """
+        self.query = query
+        self.window = window
+        self.max_phrases = min(max_phrases, self.MAX_KEYWORDS)
+
+        self.open_batches: dict[str, _Batch] = {}
+        self.lock = threading.Lock()
+
+    def get(self, phrase: str, timeframe: str) -> Series:
+        """Returns the interest over time of the phrase, indexed by date"""
+        with self.lock:
+            batch, is_leader = self.open_batches.get(timeframe), False
+
+            if batch is None:
+                batch, is_leader = _Batch(timeframe), True
+                self.open_batches[timeframe] = batch
+
+            future = batch.futures.setdefault(phrase, Future())
+
+            if len(batch.futures) >= self.max_phrases:
+                self.close(batch)
+
+        if is_leader:
+            batch.full.wait(self.window)
+
+            with self.lock:
+                self.close(batch)
+
+            self.run(batch)
+
+        return future.result()
+
+    def close(self, batch: _Batch):
+        """Stops adding phrases to the batch. Must be called with the lock held"""
+        if self.open_batches.get(batch.timeframe) is batch:
+            del self.open_batches[batch.timeframe]
+
+        batch.full.set()
+
+    def run(self, batch: _Batch):
+        try:
+            data = self.query(list(batch.futures), batch.timeframe)
+        except Exception as e:
+            for future in batch.futures.values():
+                future.set_exception(e)
+            return
+
+        for phrase, future in batch.futures.items():
+            interest = data[phrase] if phrase in data else Series(dtype=int)
+            future.set_result(self.rescale(interest) if len(batch.futures) > 1 else interest)
+
+    @staticmethod
+    def rescale(interest: Series) -> Series:
+        highest_interest = interest.max()
+        return (interest * 100 / highest_interest).round().astype(int) if highest_interest > 0 else interest
@@ -0,0 +1,142 @@
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Optional
+
+import pandas as pd
+from pandas import Series
+
+from utils.cache import LRUCache, CacheStats
+
+
+def _as_date(value: date) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _date_range(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=n) for n in range((end - start).days + 1)]
+
+
+class TrendsDayCache:
+    """
+    Caches the daily interest of each phrase, so that a query only fetches the days that are not cached yet.
+
+    Google Trends normalizes each query on its own, so that the highest value in the requested dates is 100. Hence, the
+    interest fetched in different queries can't be mixed as it is. This cache keeps the interest of each phrase in a
+    single scale: every time some days are fetched, the query is extended to also include a few cached days, and the
+    fetched interest is re-scaled so that it matches the cached one in those days. Then, the interest of the requested
+    dates is normalized again, as Google Trends would do. When the fetched interest can't be re-scaled (e.g. the
+    overlapping days have no interest at all), the requested dates are fetched at once and replace the cached ones.
+
+    The last days are never cached, as Google Trends keeps updating them. Neither are non-daily results, which Google
+    Trends returns for long date ranges
+    """
+
+    def __init__(self, fetch: Callable[[str, date, date], Series], max_phrases: int = 1000, overlap_days: int = 3,
+                 recent_days: int = 3, max_days: int = 180, today: Callable[[], date] = date.today):
+        """
+        :param fetch: A function that queries the daily interest of a phrase between two dates
+        :param max_phrases: The maximum number of phrases kept in the cache
+        :param overlap_days: The number of cached days included in a query to re-scale the fetched interest
+        :param recent_days: The number of days, counting today, that are never cached
+        :param max_days: The maximum number of days in a single query. Google Trends returns weekly data for long
+        ranges, which can't be cached
+        :param today: A function that returns the current date
+        """
+        self.fetch = fetch
+        self.overlap_days = overlap_days
+        self.recent_days = recent_days
+        self.max_days = max_days
+        self.today = today
+
+        self.histories: LRUCache[str, dict[date, float]] = LRUCache(max_phrases)
+        self.lock = threading.Lock()
+
+    def get(self, phrase: str, start_date: date, end_date: date) -> Series:
+        """Returns the daily interest of the phrase between both dates (included), normalized to a maximum of 100"""
+        start_date, end_date = _as_date(start_date), _as_date(end_date)
+
+        with self.lock:
+            history = dict(self.histories.get(phrase) or {})
+
+        for (missing_start, missing_end) in self.missing_ranges(history, start_date, end_date):
+            merged_history = self.merge(phrase, history, missing_start, missing_end)
+
+            if merged_history is None:
+                interest = self.fetch(phrase, start_date, end_date)
+                history = self.as_days(interest)
+
+                if history is None:
+                    return self.normalize(interest)
+                break
+
+            history = merged_history
+
+        last_cached_date = self.today() - timedelta(days=self.recent_days)
+        with self.lock:
+            self.histories.set(phrase, {day: value for day, value in history.items() if day <= last_cached_date})
+
+        days = [day for day in _date_range(start_date, end_date) if day in history]
+        return self.normalize(Series([history[day] for day in days], index=pd.DatetimeIndex(days), dtype=float))
+
+    def missing_ranges(self, history: dict[date, float], start_date: date, end_date: date) -> list[tuple[date, date]]:
+        """Returns the ranges of consecutive days without cached interest"""
+        ranges = []
+
+        for day in _date_range(start_date, end_date):
+            if day in history:
+                continue
+
+            if ranges and ranges[-1][1] == day - timedelta(days=1):
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+
+        return ranges
+
+    def merge(self, phrase: str, history: dict[date, float], start_date: date,
+              end_date: date) -> Optional[dict[date, float]]:
+        """Fetches the given days and re-scales them to match the cached ones. Returns None if that's not possible"""
+        if not history:
+            return None
+
+        earlier_days, later_days = [_ for _ in history if _ < start_date], [_ for _ in history if _ > end_date]
+        if earlier_days:
+            start_date = max(earlier_days) - timedelta(days=self.overlap_days - 1)
+        else:
+            end_date = min(later_days) + timedelta(days=self.overlap_days - 1)
+
+        if (end_date - start_date).days >= self.max_days:
+            return None
+
+        fetched_days = self.as_days(self.fetch(phrase, start_date, end_date))
+        if fetched_days is None:
+            return None
+
+        overlapping_days = [day for day in fetched_days if day in history]
+        cached_interest = sum(history[day] for day in overlapping_days)
+        fetched_interest = sum(fetched_days[day] for day in overlapping_days)
+
+        if cached_interest <= 0 or fetched_interest <= 0:
+            return None
+
+        scale = cached_interest / fetched_interest
+        return {**{day: value * scale for day, value in fetched_days.items()}, **history}
+
+    @staticmethod
+    def as_days(interest: Series) -> Optional[dict[date, float]]:
+        """Maps each day to its interest. Returns None if the interest isn't daily"""
+        days = [_as_date(_.to_pydatetime()) for _ in interest.index]
+
+        if any((current - previous).days != 1 for previous, current in zip(days, days[1:])):
+            return None
+
+        return dict(zip(days, interest.astype(float).tolist()))
+
+    @staticmethod
+    def normalize(interest: Series) -> Series:
+        highest_interest = interest.max() if len(interest) else 0
+        normalized_interest = (interest * 100 / highest_interest).round() if highest_interest > 0 else interest
+        return normalized_interest.astype(int)
+
+    def stats(self) -> CacheStats:
+        return self.histories.stats()
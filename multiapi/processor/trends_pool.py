@@ -0,0 +1,119 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Callable, Iterator
+
+from pytrends.exceptions import TooManyRequestsError
+from pytrends.request import TrendReq
+
+from utils.metrics import TRENDS_SESSION_WAIT
+
+
+@dataclass
+class PooledSession:
+    session: TrendReq
+    consecutive_failures: int = 0
+
+
+@dataclass
+class TrendReqPoolStats:
+    size: int = 0
+    created: int = 0
+    recycled: int = 0
+    checkouts: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    def to_json(self) -> dict:
+        return asdict(self)
+
+
+class TrendReqPool:
+    """
+    A bounded pool of independent Google Trends sessions. Each 'TrendReq' keeps the payload of the last query, so a
+    session must only be used by one thread at a time. Sessions are created lazily, and recycled (i.e. replaced by a
+    new one) as soon as Google answers with a 429 error, or after too many consecutive failures
+    """
+
+    def __init__(self, size: int = 4, factory: Callable[[], TrendReq] = TrendReq, max_failures: int = 3):
+        """
+        :param size: The maximum number of sessions
+        :param factory: A function that builds a new session
+        :param max_failures: The number of consecutive failures after which a session is recycled
+        """
+        self.size = size
+        self.factory = factory
+        self.max_failures = max_failures
+
+        self.idle: list[PooledSession] = []
+        self.open_sessions = 0
+        self.condition = threading.Condition()
+        self._stats = TrendReqPoolStats(size=size)
+
+    @contextmanager
+    def session(self) -> Iterator[TrendReq]:
+        """Checks out a session, waiting for one to be returned if all of them are in use"""
+        pooled_session = self.checkout()
+
+        try:
+            yield pooled_session.session
+        except TooManyRequestsError:
+            self.recycle()
+            raise
+        except Exception:
+            pooled_session.consecutive_failures += 1
+
+            if pooled_session.consecutive_failures >= self.max_failures:
+                self.recycle()
+            else:
+                self.checkin(pooled_session)
+            raise
+        else:
+            pooled_session.consecutive_failures = 0
+            self.checkin(pooled_session)
+
+    def checkout(self) -> PooledSession:
+        start, pooled_session = time.perf_counter(), None
+
+        with self.condition:
+            while not self.idle and self.open_sessions >= self.size:
+                self.condition.wait()
+
+            if self.idle:
+                pooled_session = self.idle.pop()
+            else:
+                self.open_sessions += 1
+                self._stats.created += 1
+
+            wait_seconds = time.perf_counter() - start
+            self._stats.checkouts += 1
+            self._stats.total_wait_seconds += wait_seconds
+            self._stats.max_wait_seconds = max(self._stats.max_wait_seconds, wait_seconds)
+
+        TRENDS_SESSION_WAIT.observe(wait_seconds)
+
+        if pooled_session is None:
+            try:
+                pooled_session = PooledSession(self.factory())
+            except Exception:
+                self.recycle()
+                raise
+
+        return pooled_session
+
+    def checkin(self, pooled_session: PooledSession):
+        with self.condition:
+            self.idle.append(pooled_session)
+            self.condition.notify()
+
+    def recycle(self):
+        """Discards a checked out session, so that a new one is created in its place"""
+        with self.condition:
+            self.open_sessions -= 1
+            self._stats.recycled += 1
+            self.condition.notify()
+
+    def stats(self) -> TrendReqPoolStats:
+        with self.condition:
+            return TrendReqPoolStats(**asdict(self._stats))
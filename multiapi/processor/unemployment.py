@@ -1,66 +1,353 @@
+import fcntl
+import hashlib
+import logging
 import re
-from datetime import datetime
+import threading
+import time
+from collections.abc import Mapping
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from typing import Optional, TextIO
 
 import httpx
-from lxml import html
+from lxml import etree, html
 
-from model import UnemploymentRate, USState, AppException
+from model import UnemploymentRate, USState, AppException, US_STATE_CODES
 
 from .base import BaseProcessor
+from utils.fast_json import dumps
+from utils.snapshot import SnapshotReader, write_snapshot
 
 
 class UnemploymentProcessor(BaseProcessor[UnemploymentRate]):
-    
-    def __init__(self, url: str, update_frequency: int = 1):
+
+    TABLE_ID = "lauhsthl"
+    CHUNK_SIZE = 16 * 1024
+    SNAPSHOT_POLL_INTERVAL = 0.1
+
+    def __init__(self, url: str, update_frequency: int = 1, snapshot_path: Optional[str] = None,
+                 client: Optional[httpx.Client] = None, snapshot_timeout: float = 10.0, retry_interval: float = 60.0):
         """
         :param url: The website URL from where to extract unemployment data
         :param update_frequency: The number of days to wait until the store is updated
+        :param snapshot_path: If given, the store is shared through a snapshot file in this path. Only one process
+        (the first one to start) fetches the data and writes the snapshot, while the rest just read it. If that process
+        exits, one of the rest takes over within 'retry_interval' seconds
+        :param client: The HTTP client to call the service with. By default, the processor builds (and closes) its own
+        :param snapshot_timeout: The number of seconds the processes that don't fetch the data wait for the first
+        snapshot, before failing the requests with a 503 error. Once that time has passed, requests fail right away
+        until there's a snapshot
+        :param retry_interval: The number of seconds to wait until a failed refresh is retried
         """
         self.url = url
-        self.store: dict[str, float] = {}
+        self.client = client or httpx.Client()
+        self.owns_client = client is None
+        self.snapshot_path = snapshot_path
+        self.snapshot_timeout = snapshot_timeout
+        self.snapshot_deadline: Optional[float] = None
+        self.store: Mapping[str, float] = {} if snapshot_path is None else SnapshotReader(snapshot_path)
+        self._store_version = 0
+        self.rendered: tuple[Optional[int], dict[str, bytes]] = (None, {})
 
-        self.last_update_date = datetime.strptime("1990-01-01", "%Y-%m-%d")
+        self._last_update_date: Optional[datetime] = None
+        self._last_refresh_date: Optional[datetime] = None
         self.update_frequency = update_frequency
+        self.retry_interval = retry_interval
+
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.content_hash: Optional[str] = None
+
+        self.refresh_lock = threading.Lock()
+        self.refresh_failed = False
+        self.last_failure = float("-inf")
+        self.stopped = threading.Event()
+        self.fetcher_lock: Optional[TextIO] = None
+
+    def setup(self):
+        """
+        Loads the store and starts refreshing it in the background, unless another process is doing so already. In
+        that case, the background thread periodically tries to take over, in case the other process exits
+        """
+        if self.snapshot_path is None or self.acquire_fetcher_lock():
+            self.refresh()
+
+        threading.Thread(target=self.refresh_periodically, name="unemployment-refresh", daemon=True).start()
+
+    def teardown(self):
+        self.stopped.set()
+
+        if self.fetcher_lock is not None:
+            self.fetcher_lock.close()
+
+        if self.owns_client:
+            self.client.close()
+
+    def acquire_fetcher_lock(self) -> bool:
+        """Tries to become the only process that fetches data and writes the snapshot"""
+        lock_file = open(f"{self.snapshot_path}.lock", "w")
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.fetcher_lock = lock_file
+            return True
+        except BlockingIOError:
+            lock_file.close()
+            return False
+
+    @property
+    def is_fetcher(self) -> bool:
+        """Whether this process fetches the data, which is always the case unless the store is shared"""
+        return self.snapshot_path is None or self.fetcher_lock is not None
+
+    def load(self):
+        """
+        Makes sure the store has data before reading it. The fetcher loads it right away, unless the last attempt
+        failed less than 'retry_interval' seconds ago, while the rest of the processes never fetch it: they wait for the
+        fetcher to write its snapshot, up to 'snapshot_timeout' seconds since the first request, shared by every request
+        so that they don't wait again once it has passed. If there's no data yet, it fails with a 503
+        """
+        if self.store:
+            return
+
+        if self.is_fetcher:
+            self.refresh(wait=True)
+
+            if not self.store:
+                raise AppException("Unemployment rates are not available yet", 503)
+            return
+
+        if self.snapshot_deadline is None:
+            self.snapshot_deadline = time.monotonic() + self.snapshot_timeout
+
+        self.store.reload()
+
+        while not self.store and time.monotonic() < self.snapshot_deadline:
+            self.stopped.wait(self.SNAPSHOT_POLL_INTERVAL)
+            self.store.reload()
+
+        if not self.store:
+            raise AppException("Unemployment rates are not available yet", 503)
+
+    @property
+    def backing_off(self) -> bool:
+        """Whether the last refresh failed less than 'retry_interval' seconds ago, so it shouldn't be retried yet"""
+        return self.refresh_failed and time.monotonic() - self.last_failure < self.retry_interval
+
+    @property
+    def last_update_date(self) -> Optional[datetime]:
+        """The date the source data was last updated"""
+        return self.store.update_date if isinstance(self.store, SnapshotReader) else self._last_update_date
+
+    @last_update_date.setter
+    def last_update_date(self, value: datetime):
+        self._last_update_date = value
+
+    @property
+    def last_refresh_date(self) -> Optional[datetime]:
+        """The date the store was last refreshed"""
+        return self.store.refreshed_at if isinstance(self.store, SnapshotReader) else self._last_refresh_date
+
+    @property
+    def store_version(self) -> Optional[int]:
+        """Identifies the data in the store, changing every time the store is replaced"""
+        return self.store.version if isinstance(self.store, SnapshotReader) else self._store_version
+
+    @property
+    def is_stale(self) -> bool:
+        """Whether the store is older than the update frequency, which happens when the last refresh failed"""
+        if self.last_refresh_date is None:
+            return True
+
+        return self.refresh_failed or datetime.now() - self.last_refresh_date > timedelta(days=self.update_frequency)
 
     def get(self, value: USState) -> UnemploymentRate:
-        self.check_if_update_is_required()
-        current_rate = self.store.get(USState.of(value))
+        self.load()
+
+        current_rate = self.store.get(value.upper())
 
         if current_rate is not None:
             return UnemploymentRate(current_rate)
         else:
             raise AppException(f"Unable to retrieve unemployment rate for state {value}")
 
-    def parse(self) -> dict[str, float]:
-        """Extracts and parses data from the given URL"""
-        response = httpx.get(self.url)
+    def get_json(self, value: USState) -> bytes:
+        """
+        Same as 'get', but returns the JSON body of the response. The bodies of every state are serialized once per
+        version of the store, so serving a request only takes a lookup
+        """
+        self.load()
+
+        version, bodies = self.rendered
+        if version != self.store_version or not bodies:
+            version = self.store_version
+            bodies = {state: dumps(asdict(UnemploymentRate(rate))) for state, rate in self.store.items()}
+            self.rendered = (version, bodies)
+
+        body = bodies.get(value.upper())
+
+        if body is not None:
+            return body
+        else:
+            raise AppException(f"Unable to retrieve unemployment rate for state {value}")
+
+    def parse(self) -> Optional[dict[str, float]]:
+        """
+        Extracts and parses data from the given URL. The page is requested conditionally, so it returns None without
+        parsing anything if the page hasn't changed since it was last parsed
+        """
+        response = self.client.get(self.url, headers=self.conditional_headers())
+        if response.status_code == httpx.codes.NOT_MODIFIED:
+            return None
+
         response.raise_for_status()
 
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        if self.store and content_hash == self.content_hash:
+            return None
+
+        rates = self.parse_page(response.text)
+        self.etag, self.last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        self.content_hash = content_hash
+
+        return rates
+
+    def conditional_headers(self) -> dict[str, str]:
+        """Returns the headers to only download the page if it has changed since it was last parsed"""
+        headers = {}
+
+        if self.store and self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.store and self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+    def parse_page(self, page: str) -> dict[str, float]:
+        """
+        Parses only the parts of the page with the table and the update date (see 'parse_page_stream'). If that fails,
+        the whole page is parsed instead (see 'parse_page_tree')
+        """
+        try:
+            rates, self.last_update_date = self.parse_page_stream(page)
+            return rates
+        except Exception as e:
+            logging.warning("Unable to parse the unemployment page as a stream, parsing the whole page: %s", e)
+            return self.parse_page_tree(page)
+
+    def parse_page_stream(self, page: str) -> tuple[dict[str, float], datetime]:
+        """
+        Parses the rates table and the update date of the page without building the tree of the whole page. The page,
+        which is already downloaded and decoded, is searched for the table and the update paragraph, which are the only
+        parts parsed. The rows of the table are parsed in chunks and freed as soon as they are read
+        """
+        table_start = page.rfind("<table", 0, page.index(f'id="{self.TABLE_ID}"'))
+        table_end = page.index("</table>", table_start) + len("</table>")
+        update_start = page.rfind("<p", 0, page.index('class="update"', table_end))
+        update_end = page.index("</p>", update_start) + len("</p>")
+
+        parser, rates = etree.HTMLPullParser(events=("end",), tag="tr"), {}
+
+        for offset in range(table_start, table_end, self.CHUNK_SIZE):
+            parser.feed(page[offset:min(offset + self.CHUNK_SIZE, table_end)])
+
+            for _, row in parser.read_events():
+                if row.getparent().tag == "tbody":
+                    self.add_rate(rates, row)
+
+                row.clear()
+
+        update_date = self.parse_update_date(html.fragment_fromstring(page[update_start:update_end]))
+
+        if not rates:
+            raise ValueError("the rates table is empty")
+
+        return rates, update_date
+
+    def parse_page_tree(self, page: str) -> dict[str, float]:
         try:
-            rates, tree = {}, html.fromstring(response.text)
-            table = tree.get_element_by_id("lauhsthl")
+            rates, tree = {}, html.fromstring(page)
+            table = tree.get_element_by_id(self.TABLE_ID)
 
             self.last_update_date = self.get_update_date(tree)
 
             for row in table.find("tbody").getchildren():
-                state_name, last_month_rate = row.find("th/p").text, row.find("td[1]/span").text
-                rates[state_name] = float(last_month_rate)
+                self.add_rate(rates, row)
 
             return rates
         except Exception as e:
             raise AppException(f"Unable to parse unemployment rate table: {str(e)}")
 
-    def check_if_update_is_required(self):
-        """Checks if the store needs to be updated"""
-        if (datetime.now() - self.last_update_date).days >= self.update_frequency:
-            self.store = self.parse()
+    @staticmethod
+    def add_rate(rates: dict[str, float], row: etree.ElementBase):
+        """Adds the rate in a row of the table, keyed by the alpha code of its state. Unknown states are skipped"""
+        state_name, last_month_rate = row.find("th/p").text, row.find("td[1]/span").text
+        state_code = US_STATE_CODES.get(state_name.strip())
+
+        if state_code is not None:
+            rates[state_code] = float(last_month_rate)
+
+    def refresh(self, wait: bool = False):
+        """
+        Replaces the store with freshly parsed data. Only one refresh runs at a time: if there is one running already,
+        this method returns immediately, unless 'wait' is True. Requests keep reading the current store meanwhile, and
+        keep doing so if the refresh fails
+
+        :param wait: If True, waits for the running refresh to finish and then refreshes only if the store is empty and
+        the last refresh didn't fail less than 'retry_interval' seconds ago
+        """
+        if not self.is_fetcher:
+            return
+
+        if not self.refresh_lock.acquire(blocking=wait):
+            return
+
+        try:
+            if wait and (self.store or self.backing_off):
+                return
+
+            rates = self.parse()
+
+            if isinstance(self.store, SnapshotReader):
+                write_snapshot(self.snapshot_path, rates if rates is not None else dict(self.store),
+                               self._last_update_date)
+                self.store.reload()
+            elif rates is not None:
+                self.store, self._store_version = rates, self._store_version + 1
+
+            self._last_refresh_date, self.refresh_failed = datetime.now(), False
+        except Exception as e:
+            self.refresh_failed, self.last_failure = True, time.monotonic()
+            logging.warning("Unable to refresh the unemployment rates: %s", e)
+        finally:
+            self.refresh_lock.release()
+
+    def refresh_periodically(self):
+        """
+        Refreshes the store every 'update_frequency' days, or every 'retry_interval' seconds after a failure. Processes
+        that don't fetch the data try to take over every 'retry_interval' seconds instead, and refresh once they do
+        """
+        while not self.stopped.wait(self.next_refresh_delay()):
+            if not self.is_fetcher and self.acquire_fetcher_lock():
+                logging.info("Taking over fetching the unemployment rates")
+
+            self.refresh()
+
+    def next_refresh_delay(self) -> float:
+        if self.refresh_failed or not self.is_fetcher:
+            return self.retry_interval
+
+        return timedelta(days=self.update_frequency).total_seconds()
 
     @staticmethod
     def get_update_date(tree: html.HtmlElement) -> datetime:
         update_tag, *_ = tree.xpath("//p[@class='update']")
+        return UnemploymentProcessor.parse_update_date(update_tag)
+
+    @staticmethod
+    def parse_update_date(update_tag: etree.ElementBase) -> datetime:
         *_, raw_date = update_tag.itertext()
         formatted_date = " ".join(re.findall(r"\w+", raw_date))
 
         return datetime.strptime(formatted_date, "%B %d %Y")
 
-
@@ -1,67 +1,139 @@
+import asyncio
 from datetime import datetime, timedelta
+from typing import Optional
 
 import httpx
 from lxml import etree
-from ipregistry import IpregistryClient
 
 from model import Weather, WeatherDay
 from .base import AsyncBaseProcessor
+from .ip_location import IpLocationProcessor
+from utils.cache import LRUCache
+from utils.concurrency import gather_or_cancel
+from utils.datetime import query_format
+from utils.fast_json import loads
+from utils.resilience import Resilience
 
 
 class WeatherProcessor(AsyncBaseProcessor[Weather]):
 
     ENDPOINT = "/history.xml"
-
-    def __init__(self, url: str, ip_registry_key: str, weather_api_key: str):
+    JSON_ENDPOINT = "/history.json"
+    DAYS = 7
+
+    def __init__(self, url: str, ip_registry_key: str, weather_api_key: str, max_concurrency: int = DAYS,
+                 cache_size: int = 10_000, today_ttl: float = 600, ip_location: Optional[IpLocationProcessor] = None,
+                 client: Optional[httpx.AsyncClient] = None, use_json: bool = False,
+                 resilience: Optional[Resilience] = None):
+        """
+        :param max_concurrency: The maximum number of requests sent to the weather API at the same time
+        :param cache_size: The maximum number of days kept in the cache. Past days never change, so they are only
+        removed from the cache when evicted
+        :param today_ttl: The number of seconds the current day is cached for, as its data is still changing
+        :param ip_location: The processor that locates the client IPs. By default, it's built from 'ip_registry_key'
+        :param client: The HTTP client to call the service with. By default, the processor builds (and closes) its own
+        :param use_json: If True, the weather API is asked for JSON instead of XML, which is faster to parse
+        :param resilience: Guards the requests to the weather API. When they fail fast, or miss their deadline, the
+        expired day in the cache is returned, if any
+        """
         self.url = url
-        self.client = httpx.AsyncClient(base_url=url)
+        self.client = client or httpx.AsyncClient(base_url=url)
+        self.owns_client = client is None
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.cache: LRUCache[tuple[str, str], WeatherDay] = LRUCache(cache_size)
+        self.today_ttl = today_ttl
 
-        self.ip_registry = IpregistryClient(ip_registry_key)
+        self.ip_location = ip_location or IpLocationProcessor("https://api.ipregistry.co", ip_registry_key)
         self.weather_api_key = weather_api_key
+        self.use_json = use_json
+        self.resilience = resilience or Resilience("weatherapi")
 
     async def async_teardown(self):
-        await self.client.aclose()
+        if self.owns_client:
+            await self.client.aclose()
+        await self.ip_location.async_teardown()
 
-    async def get(self, client_ip: str, start_date: datetime = datetime.now()) -> Weather:
-        weather_data, location = [], self.lookup(client_ip)
+    def flight_key(self, client_ip: str, start_date: Optional[datetime] = None) -> tuple:
+        return client_ip, query_format(start_date or datetime.now())
 
-        for date in [start_date - timedelta(days=n) for n in range(7)]:
-            date_str = date.strftime("%Y-%m-%d")
-            query_parameters = {
-                "key": self.weather_api_key,
-                "q": location,
-                "dt": date_str
-            }
+    async def get(self, client_ip: str, start_date: Optional[datetime] = None) -> Weather:
+        start_date = start_date or datetime.now()
+        location = await self.lookup(client_ip)
+        dates = [start_date - timedelta(days=n) for n in range(self.DAYS)]
 
-            response = await self.client.get(self.ENDPOINT, params=query_parameters)
-            response.raise_for_status()
+        weather_data = await gather_or_cancel(self.get_day(location, date.strftime("%Y-%m-%d")) for date in dates)
+        return Weather(weather_data)
 
-            day_data = self.parse(date_str, response.content)
-            weather_data.append(day_data)
+    async def get_day(self, location: str, date_str: str) -> WeatherDay:
+        key = (location, date_str)
+        day_data = self.cache.get(key)
 
-        return Weather(weather_data)
+        async def fetch_and_cache() -> WeatherDay:
+            fetched_day_data = await self.fetch_day(location, date_str)
+            is_past_day = date_str < query_format(datetime.now())
+            self.cache.set(key, fetched_day_data, ttl=None if is_past_day else self.today_ttl)
+            return fetched_day_data
+
+        if day_data is None:
+            day_data = await self.resilience.call(fetch_and_cache, lambda: self.cache.get(key, stale=True))
+
+        return day_data
+
+    async def fetch_day(self, location: str, date_str: str) -> WeatherDay:
+        query_parameters = {
+            "key": self.weather_api_key,
+            "q": location,
+            "dt": date_str
+        }
 
-    def lookup(self, client_ip: str) -> str:
-        ip_info = self.ip_registry.lookup(client_ip)
-        return f"{ip_info.location['latitude']},{ip_info.location['longitude']}"
+        async with self.semaphore:
+            response = await self.client.get(self.JSON_ENDPOINT if self.use_json else self.ENDPOINT,
+                                             params=query_parameters)
+            response.raise_for_status()
+
+        if self.use_json:
+            return self.parse_json(date_str, response.content)
+        return self.parse(date_str, response.content)
+
+    async def lookup(self, client_ip: str) -> str:
+        return await self.ip_location.get(client_ip)
 
     @staticmethod
     def parse(date: str, xml_input: bytes) -> WeatherDay:
-        root = etree.fromstring(xml_input)
-        day_data = root.find("forecast/forecastday/day")
-        astro_data = root.find("forecast/forecastday/astro")
+        forecast_day = etree.fromstring(xml_input).find("forecast/forecastday")
+        day_data = {element.tag: element for element in forecast_day.find("day")}
+        astro_data = {element.tag: element.text for element in forecast_day.find("astro")}
 
         return WeatherDay(
             date,
-            float(day_data.find("maxtemp_c").text),
-            float(day_data.find("mintemp_c").text),
-            float(day_data.find("avgtemp_c").text),
-            float(day_data.find("maxwind_kph").text),
-            float(day_data.find("totalprecip_mm").text),
-            float(day_data.find("avghumidity").text),
-            day_data.find("condition/text").text,
-            int(day_data.find("uv").text),
-            astro_data.find("sunrise").text,
-            astro_data.find("sunset").text,
+            float(day_data["maxtemp_c"].text),
+            float(day_data["mintemp_c"].text),
+            float(day_data["avgtemp_c"].text),
+            float(day_data["maxwind_kph"].text),
+            float(day_data["totalprecip_mm"].text),
+            float(day_data["avghumidity"].text),
+            day_data["condition"].findtext("text"),
+            int(float(day_data["uv"].text)),
+            astro_data["sunrise"],
+            astro_data["sunset"],
         )
 
+    @staticmethod
+    def parse_json(date: str, json_input: bytes) -> WeatherDay:
+        forecast_day = loads(json_input)["forecast"]["forecastday"][0]
+        day_data, astro_data = forecast_day["day"], forecast_day["astro"]
+
+        return WeatherDay(
+            date,
+            float(day_data["maxtemp_c"]),
+            float(day_data["mintemp_c"]),
+            float(day_data["avgtemp_c"]),
+            float(day_data["maxwind_kph"]),
+            float(day_data["totalprecip_mm"]),
+            float(day_data["avghumidity"]),
+            day_data["condition"]["text"],
+            int(day_data["uv"]),
+            astro_data["sunrise"],
+            astro_data["sunset"],
+        )
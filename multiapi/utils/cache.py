@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Generic, Hashable, Optional, TypeVar, Callable
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stale_hits: int = 0
+    evictions: int = 0
+    size: int = 0
+    max_size: int = 0
+
+    def to_json(self) -> dict:
+        return asdict(self)
+
+
+class LRUCache(Generic[K, V]):
+    """
+    A thread-safe, size-bounded cache that evicts the least recently used entries first. Entries can optionally
+    expire after a number of seconds, either set for the whole cache or per entry
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None, timer: Callable[[], float] = time.monotonic):
+        """
+        :param max_size: The maximum number of entries to keep
+        :param ttl: The default number of seconds an entry lives. If None, entries only leave the cache when evicted
+        :param timer: A monotonic clock, in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timer = timer
+
+        self._entries: OrderedDict[K, tuple[V, Optional[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats(max_size=max_size)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K, default: Optional[V] = None, stale: bool = False) -> Optional[V]:
+        """
+        :param stale: If True, expired entries are returned too, e.g. to answer with them when a fresh value can't be
+        fetched. Expired entries are kept until they're replaced or evicted. As these reads follow a missed one, they
+        aren't counted as hits nor misses, but as stale hits when they return an entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or not (stale or entry[1] is None or entry[1] > self.timer()):
+                if not stale:
+                    self._stats.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            if stale:
+                self._stats.stale_hits += 1
+            else:
+                self._stats.hits += 1
+            return entry[0]
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None):
+        """Stores a value. The 'ttl' argument overrides the cache's default one for this entry"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else self.timer() + ttl
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(**{**asdict(self._stats), "size": len(self._entries)})
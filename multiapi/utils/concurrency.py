@@ -0,0 +1,21 @@
+import asyncio
+from typing import Awaitable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+
+async def gather_or_cancel(awaitables: Iterable[Awaitable[T]]) -> list[T]:
+    """
+    Runs the given awaitables concurrently and returns their results in the same order. If any of them fails, the
+    ones still in flight are cancelled (and awaited) before the exception is propagated
+    """
+    tasks = [asyncio.ensure_future(_) for _ in awaitables]
+
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
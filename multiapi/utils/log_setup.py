@@ -1,17 +1,75 @@
+import atexit
 import logging
 import os
+import queue
+import random
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
 
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-def setup_logging():
+from .fast_json import dumps
+from .metrics import MetricsMiddleware
+
+TEXT_FORMAT = "[%(asctime)s] %(request_id)s {%(module)s:%(lineno)d} %(levelname)s - %(message)s"
+REQUEST_ID_HEADER = b"x-request-id"
+
+REQUEST_ID: ContextVar[str] = ContextVar("request_id", default="-")
+ROUTE: ContextVar[str] = ContextVar("route", default="-")
+SAMPLED: ContextVar[bool] = ContextVar("sampled", default=True)
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+def setup_logging(stream: Optional[TextIO] = None) -> QueueListener:
     """
     Logging level can be set up via the environment variable 'LOG_LEVEL'. The available log levels are listed in
     https://docs.python.org/3/library/logging.html#logging-levels
+
+    Logging calls only put their records into a queue, while a background thread formats them and writes them into the
+    stream (stderr by default), so that a slow stream never blocks the asyncio loop. Records are written as JSON
+    objects, or as text lines if the environment variable 'LOG_FORMAT' is 'text', and both include the ID of the
+    request they were logged in (see 'RequestContextMiddleware')
+    """
+    global _listener, _queue_handler
+
+    stop_logging()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter() if _get_log_format() == "json" else logging.Formatter(TEXT_FORMAT, "%H:%M:%S"))
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = DeferredQueueHandler(log_queue)
+    _queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(_get_log_level())
+
+    _listener = QueueListener(log_queue, handler)
+    _listener.start()
+
+    return _listener
+
+
+@atexit.register
+def stop_logging():
+    """
+    Removes the queue handler from the root logger, so that no more records are put into the queue, and then writes the
+    records left in it and stops the background thread
     """
-    logging.basicConfig(
-        level=_get_log_level(),
-        format='[%(asctime)s] {%(pathname)s:%(lineno)d} %(levelname)s - %(message)s',
-        datefmt='%H:%M:%S'
-    )
+    global _listener, _queue_handler
+
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 
 def _get_log_level() -> int:
@@ -19,3 +77,102 @@ def _get_log_level() -> int:
     log_level = logging.getLevelName(raw_level)
 
     return logging.INFO if not isinstance(log_level, int) else log_level
+
+
+def _get_log_format() -> str:
+    return "text" if os.getenv("LOG_FORMAT", "json").lower() == "text" else "json"
+
+
+def parse_sample_rates(value: str) -> dict[str, float]:
+    """Parses the sampling rates of the routes, written as '/health=0,/weather=0.1'"""
+    rates = {}
+
+    for item in filter(None, (_.strip() for _ in value.split(","))):
+        route, _, rate = item.rpartition("=")
+        rates[route] = float(rate)
+
+    return rates
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Puts the records into the queue as they are. Unlike 'QueueHandler', their messages aren't formatted here but by the
+    listener's thread, so the arguments of a record must not be modified after logging it
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Adds the ID and the route of the current request to the records, and drops the info and debug records of the
+    requests that are not sampled
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.INFO and not SAMPLED.get():
+            return False
+
+        record.request_id, record.route = REQUEST_ID.get(), ROUTE.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "location": f"{record.module}:{record.lineno}",
+            "request_id": getattr(record, "request_id", "-"),
+            "route": getattr(record, "route", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return dumps(entry).decode("utf-8")
+
+
+class RequestContextMiddleware:
+    """
+    Sets the ID of each request, taken from its 'X-Request-ID' header or generated otherwise, and returns it in the same
+    header of the response. Each request is also sampled with the rate of its route, so that only the info and debug
+    records of a share of the requests are logged (warnings and errors are always logged)
+    """
+
+    def __init__(self, app: ASGIApp, sample_rates: Optional[dict[str, float]] = None, default_sample_rate: float = 1.0):
+        """
+        :param sample_rates: The share of requests of each route, by its path template, whose records are logged
+        :param default_sample_rate: The share of requests of the other routes whose records are logged
+        """
+        self.app = app
+        self.sample_rates = sample_rates or {}
+        self.default_sample_rate = default_sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route = MetricsMiddleware.route_of(scope)
+        request_id = next((value.decode("latin-1") for name, value in scope["headers"]
+                           if name == REQUEST_ID_HEADER), None) or uuid.uuid4().hex
+        sample_rate = self.sample_rates.get(route, self.default_sample_rate)
+
+        async def send_with_request_id(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (REQUEST_ID_HEADER, request_id.encode("latin-1"))]
+            await send(message)
+
+        tokens = [
+            (REQUEST_ID, REQUEST_ID.set(request_id)),
+            (ROUTE, ROUTE.set(route)),
+            (SAMPLED, SAMPLED.set(sample_rate >= 1 or random.random() < sample_rate)),
+        ]
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            for variable, token in tokens:
+                variable.reset(token)
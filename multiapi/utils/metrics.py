@@ -0,0 +1,196 @@
+"""
+Prometheus metrics of the app. When it runs with several uvicorn workers, each worker writes its metrics into the
+directory set in the environment variable 'PROMETHEUS_MULTIPROC_DIR', which must be empty before the app starts, and
+'/metrics' aggregates the ones of every worker (see https://github.com/prometheus/client_python#multiprocess-mode)
+"""
+import asyncio
+import contextlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from anyio import to_thread
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, \
+    generate_latest
+from prometheus_client import multiprocess
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+ROUTE_SCOPE_KEY = "multiapi.route"
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+REQUEST_LATENCY = Histogram(
+    "multiapi_request_duration_seconds", "Time taken to answer the requests of each route",
+    ["route", "method", "status"]
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "multiapi_requests_in_progress", "Requests of each route being answered", ["route", "method"],
+    multiprocess_mode="livesum"
+)
+UPSTREAM_LATENCY = Histogram(
+    "multiapi_upstream_request_duration_seconds",
+    "Time taken by the requests to each external service until their response arrives", ["upstream", "status"]
+)
+TRENDS_SESSION_WAIT = Histogram(
+    "multiapi_trends_session_wait_seconds", "Time that each Google Trends query waits for a session from the pool"
+)
+EVENT_LOOP_LAG = Histogram(
+    "multiapi_event_loop_lag_seconds", "How late the asyncio loop runs a callback scheduled for a given time",
+    buckets=LAG_BUCKETS
+)
+EVENT_LOOP_STALL_DURATION = Histogram(
+    "multiapi_event_loop_stall_seconds", "Periods in which the asyncio loop was blocked, by route and processor",
+    ["route", "processor"], buckets=LAG_BUCKETS
+)
+BREAKER_STATE = Gauge(
+    "multiapi_circuit_breaker_state", "State of the circuit breaker of each external service: 0 is closed, 1 is "
+    "half-open and 2 is open (the highest across the workers)", ["upstream"], multiprocess_mode="max"
+)
+BREAKER_REJECTIONS = Counter(
+    "multiapi_circuit_breaker_rejections", "Calls to each external service failed fast by its open circuit breaker",
+    ["upstream"]
+)
+DEADLINES_EXCEEDED = Counter(
+    "multiapi_upstream_deadlines_exceeded", "Calls to each external service cancelled after their deadline",
+    ["upstream"]
+)
+CACHED_FALLBACKS = Counter(
+    "multiapi_upstream_cached_fallbacks", "Calls to each external service answered with cached data after failing",
+    ["upstream"]
+)
+HEDGED_REQUESTS = Counter(
+    "multiapi_hedged_requests", "Calls to each external service that sent a second, hedged attempt", ["upstream"]
+)
+HEDGED_REQUEST_WINS = Counter(
+    "multiapi_hedged_request_wins", "Hedged attempts to each external service that answered before the first one",
+    ["upstream"]
+)
+THREADPOOL_QUEUE_DEPTH = Gauge(
+    "multiapi_threadpool_queue_depth", "Tasks waiting for a free thread in each thread pool", ["pool"],
+    multiprocess_mode="livesum"
+)
+THREADPOOL_BUSY_THREADS = Gauge(
+    "multiapi_threadpool_busy_threads", "Threads running a task in each thread pool", ["pool"],
+    multiprocess_mode="livesum"
+)
+
+
+def render() -> tuple[bytes, str]:
+    """Returns the metrics in the Prometheus text format, together with its content type"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """Removes the gauges of this worker from the aggregated ones. Meant to be called when the worker shuts down"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class UpstreamTimer:
+    """
+    Observes the time taken by a request to an external service, labelled by its status code. Requests that raise are
+    labelled with the status code of their response, if any, or as 'error'
+    """
+
+    def __init__(self, upstream: str):
+        self.upstream = upstream
+        self.status = "error"
+        self.start = 0.0
+
+    def __enter__(self) -> "UpstreamTimer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, _, exc: Optional[BaseException], __):
+        if exc is not None:
+            status_code = getattr(getattr(exc, "response", None), "status_code", None)
+            self.status = "error" if status_code is None else str(status_code)
+
+        UPSTREAM_LATENCY.labels(self.upstream, self.status).observe(time.perf_counter() - self.start)
+
+
+class MetricsMiddleware:
+    """
+    Observes the latency and the requests in progress of each route. Requests are labelled with the path template of
+    their route (e.g. '/unemployment/{state}'), so that the number of series doesn't grow with the requested paths
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route, method, status = self.route_of(scope), scope["method"], "500"
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(route, method)
+        in_progress.inc()
+        start = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_LATENCY.labels(route, method, status).observe(time.perf_counter() - start)
+            in_progress.dec()
+
+    @staticmethod
+    def route_of(scope: Scope) -> str:
+        """Finds the path template of the request's route, keeping it in the scope so that it's only found once"""
+        if ROUTE_SCOPE_KEY not in scope:
+            scope[ROUTE_SCOPE_KEY] = next(
+                (route.path for route in scope["app"].router.routes if route.matches(scope)[0] == Match.FULL),
+                "unmatched"
+            )
+
+        return scope[ROUTE_SCOPE_KEY]
+
+
+class RuntimeMonitor:
+    """
+    Samples, every 'interval' seconds, how late the asyncio loop wakes up from a sleep (its lag) and how busy the thread
+    pools are: the one running the sync handlers and the given executors
+    """
+
+    def __init__(self, interval: float = 0.5, executors: Optional[dict[str, ThreadPoolExecutor]] = None):
+        self.interval = interval
+        self.executors = executors or {}
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        limiter = to_thread.current_default_thread_limiter()
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(loop.time() - start - self.interval, 0.0))
+
+            statistics = limiter.statistics()
+            THREADPOOL_QUEUE_DEPTH.labels("handlers").set(statistics.tasks_waiting)
+            THREADPOOL_BUSY_THREADS.labels("handlers").set(statistics.borrowed_tokens)
+
+            for name, executor in self.executors.items():
+                THREADPOOL_QUEUE_DEPTH.labels(name).set(executor._work_queue.qsize())
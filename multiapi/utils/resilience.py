@@ -0,0 +1,189 @@
+import asyncio
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+
+from model import AppException
+from .metrics import BREAKER_STATE, BREAKER_REJECTIONS, DEADLINES_EXCEEDED, CACHED_FALLBACKS, HEDGED_REQUESTS, \
+    HEDGED_REQUEST_WINS
+
+T = TypeVar("T")
+
+
+class BreakerState(IntEnum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+class CircuitBreaker:
+    """
+    Opens after a number of consecutive failures, rejecting every call until 'recovery_time' seconds have passed. Then,
+    a single trial call is let through: the breaker closes if it succeeds, or opens again otherwise. It's meant to be
+    used from the asyncio loop only, so it isn't thread-safe
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_time: float = 30.0,
+                 timer: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.timer = timer
+
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        BREAKER_STATE.labels(name).set(self.state)
+
+    def allow(self) -> bool:
+        # A trial call that never finished (e.g. it was cancelled) is replaced by another one after 'recovery_time'
+        if self.state != BreakerState.CLOSED and self.timer() - self.opened_at >= self.recovery_time:
+            self.opened_at = self.timer()
+            self._move_to(BreakerState.HALF_OPEN)
+            return True
+
+        return self.state == BreakerState.CLOSED
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != BreakerState.CLOSED:
+            self._move_to(BreakerState.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == BreakerState.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = self.timer()
+            self._move_to(BreakerState.OPEN)
+
+    def _move_to(self, state: BreakerState):
+        self.state = state
+        BREAKER_STATE.labels(self.name).set(state)
+
+
+class Resilience:
+    """
+    Guards the calls to an external service so that they don't inherit its worst latency:
+      1. Each call has a deadline, after which it's cancelled.
+      2. A circuit breaker fails calls fast after consecutive failures, while the service recovers.
+      3. Optionally, a call that takes longer than the given quantile of the latest latencies is hedged: a second
+      attempt is sent, and the first one to succeed is used.
+
+    Calls that fail fast, or miss their deadline, are answered with the fallback when it has a value (e.g. a stale
+    cached one), and raise an 'AppException' with a 503 or 504 status otherwise
+    """
+
+    LATENCY_SAMPLES = 200
+    MIN_HEDGE_SAMPLES = 20
+
+    def __init__(self, name: str, deadline: float = 0, failure_threshold: int = 5, recovery_time: float = 30.0,
+                 hedge: bool = False, hedge_quantile: float = 0.95, timer: Callable[[], float] = time.monotonic):
+        """
+        :param deadline: The number of seconds a call can take, including its hedged attempt. 0 disables it
+        :param failure_threshold: The number of consecutive failures that open the circuit breaker
+        :param recovery_time: The number of seconds the circuit breaker stays open before letting a trial call through
+        :param hedge: If True, calls are hedged once there are enough latencies to estimate the quantile
+        :param hedge_quantile: The quantile of the latest latencies after which a call is hedged
+        """
+        self.name = name
+        self.deadline = deadline
+        self.breaker = CircuitBreaker(name, failure_threshold, recovery_time, timer)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.latencies: deque[float] = deque(maxlen=self.LATENCY_SAMPLES)
+
+    async def call(self, attempt: Callable[[], Awaitable[T]], fallback: Callable[[], Optional[T]] = lambda: None) -> T:
+        """
+        :param attempt: Sends a request to the service. It may be called twice when hedging, so it must be idempotent
+        :param fallback: Returns the value to answer with when the call fails fast or misses its deadline, if any
+        """
+        if not self.breaker.allow():
+            BREAKER_REJECTIONS.labels(self.name).inc()
+            return self._fall_back(fallback, AppException(f"The {self.name} service is unavailable", 503))
+
+        try:
+            result = await asyncio.wait_for(self._hedged(attempt), self.deadline or None)
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            DEADLINES_EXCEEDED.labels(self.name).inc()
+            return self._fall_back(fallback, AppException(f"The {self.name} service took too long to answer", 504))
+        except Exception as e:
+            if self.is_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+
+        self.breaker.record_success()
+        return result
+
+    def hedge_delay(self) -> Optional[float]:
+        """The latency quantile after which a call is hedged, or None if it shouldn't be"""
+        if not self.hedge or len(self.latencies) < self.MIN_HEDGE_SAMPLES:
+            return None
+
+        latencies = sorted(self.latencies)
+        return latencies[min(int(len(latencies) * self.hedge_quantile), len(latencies) - 1)]
+
+    @staticmethod
+    def is_failure(error: Exception) -> bool:
+        """
+        Only the errors of the service count as failures: the ones reaching it and its 5xx and 429 responses. The rest
+        of the errors, such as other client errors or an answer without data, are caused by the request
+        """
+        if isinstance(error, httpx.HTTPStatusError):
+            status_code = error.response.status_code
+            return status_code >= 500 or status_code == 429
+
+        return isinstance(error, httpx.TransportError)
+
+    def _fall_back(self, fallback: Callable[[], Optional[T]], error: AppException) -> T:
+        result = fallback()
+        if result is None:
+            raise error
+
+        CACHED_FALLBACKS.labels(self.name).inc()
+        return result
+
+    async def _timed(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        result = await attempt()
+        self.latencies.append(time.perf_counter() - start)
+
+        return result
+
+    async def _hedged(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._timed(attempt)
+
+        first = asyncio.ensure_future(self._timed(attempt))
+        pending = {first}
+
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+
+            HEDGED_REQUESTS.labels(self.name).inc()
+            second = asyncio.ensure_future(self._timed(attempt))
+            pending.add(second)
+            error: Optional[BaseException] = None
+
+            # The first attempt to succeed is used. If both fail, the first error is raised
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in sorted(done, key=lambda _: _ is second):
+                    if task.exception() is None:
+                        if task is second:
+                            HEDGED_REQUEST_WINS.labels(self.name).inc()
+                        return task.result()
+                    error = error or task.exception()
+
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,147 @@
+"""
+A compact, versioned file format to share a mapping of short strings to floats between processes. A snapshot holds:
+
+  - A header with a magic string, a version, the time it was written, the date of its data and the number of records.
+  - A sequence of fixed-width records, each one made of a UTF-8 key padded with zeros and a float value.
+
+Snapshots are replaced atomically, so readers either see the previous version or the new one, but never a mix.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Iterator, Optional
+
+MAGIC = b"MAPISNAP"
+HEADER = struct.Struct("<8sQddI")
+RECORD = struct.Struct("<24sd")
+
+
+def write_snapshot(path: str, values: Mapping[str, float], update_date: Optional[datetime] = None) -> int:
+    """Writes the values into a new snapshot version, replacing the one in the given path. Returns the version"""
+    version = time.time_ns()
+    update_timestamp = update_date.timestamp() if update_date is not None else 0.0
+
+    content = bytearray(HEADER.pack(MAGIC, version, time.time(), update_timestamp, len(values)))
+    for key, value in values.items():
+        encoded_key = key.encode("utf-8")
+        if len(encoded_key) > 24:
+            raise ValueError(f"Snapshot keys cannot be longer than 24 bytes: {key}")
+
+        content += RECORD.pack(encoded_key, value)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+    return version
+
+
+class _MappedSnapshot:
+    """A single snapshot version mapped into memory. Values are read straight from the mapped file"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.version, self.refreshed_at, update_timestamp, count = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or len(self.buffer) != HEADER.size + count * RECORD.size:
+            raise ValueError(f"{path} is not a valid snapshot")
+
+        self.update_date = datetime.fromtimestamp(update_timestamp) if update_timestamp else None
+        self.offsets = {
+            bytes(self.buffer[offset:offset + 24]).rstrip(b"\0").decode("utf-8"): offset + 24
+            for offset in range(HEADER.size, len(self.buffer), RECORD.size)
+        }
+
+    def get(self, key: str) -> Optional[float]:
+        offset = self.offsets.get(key)
+        return struct.unpack_from("<d", self.buffer, offset)[0] if offset is not None else None
+
+
+class SnapshotReader(Mapping):
+    """
+    A read-only mapping backed by a snapshot file. The file is checked for new versions at most once every
+    'check_interval' seconds, and the reader switches to a new version as soon as it finds one
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+
+        self._snapshot: Optional[_MappedSnapshot] = None
+        self._file_id: Optional[tuple] = None
+        self._last_check = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> Optional[_MappedSnapshot]:
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self.reload()
+
+        return self._snapshot
+
+    @property
+    def version(self) -> Optional[int]:
+        snapshot = self.snapshot
+        return snapshot.version if snapshot is not None else None
+
+    @property
+    def refreshed_at(self) -> Optional[datetime]:
+        snapshot = self.snapshot
+        return datetime.fromtimestamp(snapshot.refreshed_at) if snapshot is not None else None
+
+    @property
+    def update_date(self) -> Optional[datetime]:
+        snapshot = self.snapshot
+        return snapshot.update_date if snapshot is not None else None
+
+    def reload(self):
+        """Maps the snapshot file again if it has been replaced since the last check"""
+        with self._lock:
+            self._last_check = time.monotonic()
+
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+
+            file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if file_id != self._file_id:
+                try:
+                    self._snapshot, self._file_id = _MappedSnapshot(self.path), file_id
+                except (OSError, ValueError):
+                    return
+
+    def get(self, key: str, default: Optional[float] = None) -> Optional[float]:
+        snapshot = self.snapshot
+        value = snapshot.get(key) if snapshot is not None else None
+        return value if value is not None else default
+
+    def __getitem__(self, key: str) -> float:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        snapshot = self.snapshot
+        return iter(snapshot.offsets if snapshot is not None else ())
+
+    def __len__(self) -> int:
+        snapshot = self.snapshot
+        return len(snapshot.offsets) if snapshot is not None else 0
@@ -0,0 +1,210 @@
+import importlib.util
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+import httpx
+from decouple import config
+
+from .metrics import UpstreamTimer
+from .resilience import Resilience
+
+
+@dataclass
+class UpstreamConfig:
+    """The connection settings of an external service, and the ones of the calls to it (see 'Resilience')"""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 5.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 10.0
+    http2: bool = False
+    deadline: float = 0.0
+    breaker_failures: int = 5
+    breaker_recovery_time: float = 30.0
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "UpstreamConfig":
+        """
+        Reads the settings from the environment variables with the given prefix, such as 'WEATHERAPI_READ_TIMEOUT',
+        falling back to the ones without it, such as 'UPSTREAM_READ_TIMEOUT', and then to the defaults
+        """
+        def setting(name: str, cast: type):
+            default = config(f"UPSTREAM_{name}", getattr(cls, name.lower()), cast=cast)
+            return config(f"{prefix}_{name}", default, cast=cast)
+
+        return cls(
+            max_connections=setting("MAX_CONNECTIONS", int),
+            max_keepalive_connections=setting("MAX_KEEPALIVE_CONNECTIONS", int),
+            keepalive_expiry=setting("KEEPALIVE_EXPIRY", float),
+            connect_timeout=setting("CONNECT_TIMEOUT", float),
+            read_timeout=setting("READ_TIMEOUT", float),
+            http2=setting("HTTP2", bool),
+            deadline=setting("DEADLINE", float),
+            breaker_failures=setting("BREAKER_FAILURES", int),
+            breaker_recovery_time=setting("BREAKER_RECOVERY_TIME", float),
+            hedge=setting("HEDGE", bool),
+            hedge_quantile=setting("HEDGE_QUANTILE", float)
+        )
+
+
+class TimedTransport(httpx.BaseTransport):
+    """Observes the time taken by each request of an external service until its response headers arrive"""
+
+    def __init__(self, upstream: str, transport: httpx.BaseTransport):
+        self.upstream = upstream
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with UpstreamTimer(self.upstream) as timer:
+            response = self.transport.handle_request(request)
+            timer.status = str(response.status_code)
+
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncTimedTransport(httpx.AsyncBaseTransport):
+    """The async version of 'TimedTransport'"""
+
+    def __init__(self, upstream: str, transport: httpx.AsyncBaseTransport):
+        self.upstream = upstream
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with UpstreamTimer(self.upstream) as timer:
+            response = await self.transport.handle_async_request(request)
+            timer.status = str(response.status_code)
+
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+@dataclass
+class ConnectionStats:
+    requests: int = 0
+    new_connections: int = 0
+
+    @property
+    def reused_connections(self) -> int:
+        return max(self.requests - self.new_connections, 0)
+
+    def to_json(self) -> dict:
+        return {**asdict(self), "reused_connections": self.reused_connections}
+
+
+class UpstreamClients:
+    """
+    A registry of pooled HTTP clients, one per external service, so that every processor calling a service shares its
+    connections. Each service has both an async and a sync client, built lazily with the same settings. The latency of
+    their requests is exported as a metric labelled with the service name. Each service has a single 'Resilience' too,
+    so that its circuit breaker opens for every processor calling it
+    """
+
+    def __init__(self):
+        self.upstreams: dict[str, tuple[str, UpstreamConfig]] = {}
+        self.async_clients: dict[str, httpx.AsyncClient] = {}
+        self.sync_clients: dict[str, httpx.Client] = {}
+        self.resiliences: dict[str, Resilience] = {}
+
+        self._stats: dict[str, ConnectionStats] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, base_url: str, upstream_config: Optional[UpstreamConfig] = None):
+        self.upstreams[name] = (base_url, upstream_config or UpstreamConfig.from_env(name.upper()))
+        self._stats[name] = ConnectionStats()
+
+    def async_client(self, name: str) -> httpx.AsyncClient:
+        if name not in self.async_clients:
+            base_url, upstream_config = self.upstreams[name]
+
+            async def trace_request(request: httpx.Request):
+                request.extensions["trace"] = self._async_tracer(name)
+
+            limits, timeout, http2 = self._client_settings(upstream_config)
+            self.async_clients[name] = httpx.AsyncClient(
+                base_url=base_url, event_hooks={"request": [trace_request]}, timeout=timeout,
+                transport=AsyncTimedTransport(name, httpx.AsyncHTTPTransport(limits=limits, http2=http2))
+            )
+
+        return self.async_clients[name]
+
+    def client(self, name: str) -> httpx.Client:
+        if name not in self.sync_clients:
+            base_url, upstream_config = self.upstreams[name]
+
+            def trace_request(request: httpx.Request):
+                request.extensions["trace"] = self._tracer(name)
+
+            limits, timeout, http2 = self._client_settings(upstream_config)
+            self.sync_clients[name] = httpx.Client(
+                base_url=base_url, event_hooks={"request": [trace_request]}, timeout=timeout,
+                transport=TimedTransport(name, httpx.HTTPTransport(limits=limits, http2=http2))
+            )
+
+        return self.sync_clients[name]
+
+    def resilience(self, name: str) -> Resilience:
+        if name not in self.resiliences:
+            _, upstream_config = self.upstreams[name]
+            self.resiliences[name] = Resilience(
+                name,
+                deadline=upstream_config.deadline,
+                failure_threshold=upstream_config.breaker_failures,
+                recovery_time=upstream_config.breaker_recovery_time,
+                hedge=upstream_config.hedge,
+                hedge_quantile=upstream_config.hedge_quantile
+            )
+
+        return self.resiliences[name]
+
+    async def aclose(self):
+        for client in self.async_clients.values():
+            await client.aclose()
+        for client in self.sync_clients.values():
+            client.close()
+
+    def stats(self) -> dict[str, ConnectionStats]:
+        with self._lock:
+            return {name: ConnectionStats(**asdict(stats)) for name, stats in self._stats.items()}
+
+    def _tracer(self, name: str):
+        def trace(event_name: str, _: dict):
+            self._count(name, event_name)
+
+        return trace
+
+    def _async_tracer(self, name: str):
+        async def trace(event_name: str, _: dict):
+            self._count(name, event_name)
+
+        return trace
+
+    def _count(self, name: str, event_name: str):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self._stats[name].new_connections += 1
+        elif event_name in ("http11.send_request_headers.started", "http2.send_request_headers.started"):
+            with self._lock:
+                self._stats[name].requests += 1
+
+    @staticmethod
+    def _client_settings(upstream_config: UpstreamConfig) -> tuple[httpx.Limits, httpx.Timeout, bool]:
+        http2 = upstream_config.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logging.warning("HTTP/2 requires the 'h2' package (pip install httpx[http2]). Using HTTP/1.1 instead")
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=upstream_config.max_connections,
+            max_keepalive_connections=upstream_config.max_keepalive_connections,
+            keepalive_expiry=upstream_config.keepalive_expiry
+        )
+        return limits, httpx.Timeout(upstream_config.read_timeout, connect=upstream_config.connect_timeout), http2
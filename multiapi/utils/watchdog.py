@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from dataclasses import dataclass, field
+from types import CodeType, FrameType
+from typing import Callable, Iterable, Optional
+
+from starlette.routing import BaseRoute
+
+from .metrics import EVENT_LOOP_STALL_DURATION
+
+UNKNOWN = "unknown"
+
+
+@dataclass(frozen=True)
+class Stall:
+    """A period in which the asyncio loop was blocked, together with what was running when it was caught"""
+    duration: float
+    route: str = UNKNOWN
+    processor: str = UNKNOWN
+    stack: list[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        return f"The event loop was blocked for {self.duration * 1000:.0f} ms in {self.route} ({self.processor})" + \
+            (":\n" + "".join(self.stack) if self.stack else "")
+
+
+class LoopWatchdog:
+    """
+    Detects when the asyncio loop is blocked for longer than 'threshold' seconds. The loop beats every half threshold,
+    and a thread checks that the beats are on time. Once a beat is late by more than the threshold, the thread captures
+    the stack of the loop's thread, which shows the code that blocks it, and the stall is reported when the loop beats
+    again, with its whole duration. Stalls shorter than the thread's checks are reported too, although without stack.
+
+    Stalls are attributed to a route, found either in the stack or in the task that created the blocked task, and to
+    the innermost processor in the stack, found by its package
+    """
+
+    def __init__(self, threshold: float = 0.1, routes: Iterable[BaseRoute] = (),
+                 on_stall: Optional[Callable[[Stall], None]] = None,
+                 processor_packages: tuple[str, ...] = ("processor",)):
+        """
+        :param routes: The routes of the app. They're read upon 'start', so they can be added after building the
+        watchdog
+        :param on_stall: Called with each stall from the asyncio loop. By default, stalls are logged and exported as
+        metrics (see 'report')
+        :param processor_packages: The packages of the processors the stalls are attributed to
+        """
+        self.threshold = threshold
+        self.interval = threshold / 2
+        self.routes = routes
+        self.on_stall = on_stall or self.report
+        self.processor_packages = processor_packages
+
+        self.endpoints: dict[CodeType, str] = {}
+        self.task_routes: weakref.WeakKeyDictionary[asyncio.Task, str] = weakref.WeakKeyDictionary()
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self.previous_task_factory = None
+        self.beat_handle: Optional[asyncio.TimerHandle] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+        self._lock = threading.Lock()
+        self._next_beat = 0.0
+        self._caught: Optional[Stall] = None
+
+    def start(self):
+        """Starts watching the running loop"""
+        self.endpoints = {route.endpoint.__code__: route.path for route in self.routes if hasattr(route, "endpoint")}
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+
+        self.previous_task_factory = self.loop.get_task_factory()
+        self.loop.set_task_factory(self.create_task)
+        self.beat()
+
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.beat_handle.cancel()
+        self.loop.set_task_factory(self.previous_task_factory)
+
+    @staticmethod
+    def report(stall: Stall):
+        EVENT_LOOP_STALL_DURATION.labels(stall.route, stall.processor).observe(stall.duration)
+        logging.warning("%s", stall)
+
+    def create_task(self, loop: asyncio.AbstractEventLoop, coro, **kwargs) -> asyncio.Task:
+        """Keeps the route of each new task, which is the one of the task creating it, to attribute its stalls"""
+        if self.previous_task_factory is not None:
+            task = self.previous_task_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+
+        route = self.route_in(sys._getframe(1)) or self.route_of_task(asyncio.current_task(loop))
+        if route is not None:
+            self.task_routes[task] = route
+
+        return task
+
+    def beat(self):
+        now = time.monotonic()
+
+        with self._lock:
+            caught, late = self._caught, now - self._next_beat if self._next_beat else 0.0
+            self._caught, self._next_beat = None, now + self.interval
+
+        if caught is not None:
+            self.on_stall(Stall(late, caught.route, caught.processor, caught.stack))
+        elif late > self.threshold:
+            self.on_stall(Stall(late))
+
+        self.beat_handle = self.loop.call_later(self.interval, self.beat)
+
+    def watch(self):
+        while not self.stopped.wait(self.interval / 2):
+            with self._lock:
+                next_beat = self._next_beat
+                if self._caught is not None or time.monotonic() - next_beat <= self.threshold:
+                    continue
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+
+            caught = Stall(
+                0.0,
+                self.route_in(frame) or self.route_of_task(asyncio.current_task(self.loop)) or UNKNOWN,
+                self.processor_in(frame) or UNKNOWN,
+                traceback.format_stack(frame)
+            )
+
+            with self._lock:
+                # The loop may have beaten meanwhile, in which case the stall is over and it's already reported
+                if self._next_beat == next_beat:
+                    self._caught = caught
+
+    def route_in(self, frame: Optional[FrameType]) -> Optional[str]:
+        while frame is not None:
+            if frame.f_code in self.endpoints:
+                return self.endpoints[frame.f_code]
+            frame = frame.f_back
+
+        return None
+
+    def route_of_task(self, task: Optional[asyncio.Task]) -> Optional[str]:
+        return self.task_routes.get(task) if task is not None else None
+
+    def processor_in(self, frame: Optional[FrameType]) -> Optional[str]:
+        while frame is not None:
+            module = frame.f_globals.get("__name__", "")
+            if any(module == package or module.startswith(f"{package}.") for package in self.processor_packages):
+                instance = frame.f_locals.get("self")
+                return type(instance).__name__ if instance is not None else module
+            frame = frame.f_back
+
+        return None
@@ -0,0 +1,6 @@
+"""
+Local stand-ins for the external services of the app, which replay recorded (or generated) payloads with a configurable
+latency, error rate and bursts of 429 errors. Run them all from the project root with 'python -m stubs'
+"""
+from .behaviour import StubBehaviour
+from .servers import STUBS, build_app
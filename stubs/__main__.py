@@ -0,0 +1,69 @@
+"""
+Runs the stubs of the external services, each on its own port. Their behaviour is set up with environment variables
+(see 'StubBehaviour.from_env'), such as 'STUB_LATENCY_MS=100' for all of them or 'STUB_TRENDS_BURST_INTERVAL=60' for
+one of them. Run it from the project root with:
+
+    python -m stubs [--host 127.0.0.1] [--stubs weatherapi trends ...]
+
+Then point the app at them with:
+
+    WEATHER_API_URL=http://127.0.0.1:9001 IP_REGISTRY_URL=http://127.0.0.1:9002 \
+    UNEMPLOYMENT_URL=http://127.0.0.1:9003/web/laus/lauhsthl.htm LIFE_EXPECTANCY_URL=http://127.0.0.1:9004 \
+    TRENDS_URL=http://127.0.0.1:9005
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import socket
+
+import uvicorn
+
+from .behaviour import StubBehaviour
+from .servers import STUBS, build_app
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    return sock
+
+
+class StubServer(uvicorn.Server):
+
+    def install_signal_handlers(self):
+        # Each server would replace the handlers of the previous one, so 'serve' stops all of them instead
+        pass
+
+
+async def serve(host: str, names: list[str]):
+    # Every port is bound before serving any stub, so that none of them is left running when another one can't start
+    sockets = {name: bind(host, STUBS[name][1]) for name in names}
+    servers = []
+
+    for name, sock in sockets.items():
+        behaviour = StubBehaviour.from_env(name.upper())
+
+        logging.info("Serving the %s stub at http://%s:%s with %s", name, host, sock.getsockname()[1], behaviour)
+        servers.append(StubServer(uvicorn.Config(build_app(name, behaviour), log_level="warning")))
+
+    def stop():
+        for server in servers:
+            server.should_exit = True
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, stop)
+
+    await asyncio.gather(*(server.serve(sockets=[sock]) for server, sock in zip(servers, sockets.values())))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    parser = argparse.ArgumentParser(prog="python -m stubs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--stubs", nargs="+", choices=list(STUBS), default=list(STUBS))
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.host, args.stubs))
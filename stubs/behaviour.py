@@ -0,0 +1,80 @@
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from decouple import config
+
+
+@dataclass
+class StubBehaviour:
+    """How a stub answers: after which delay, and how often with an error instead of the payload"""
+    latency_ms: float = 50.0
+    jitter_ms: float = 10.0
+    distribution: str = "normal"
+    error_rate: float = 0.0
+    burst_interval: float = 0.0
+    burst_duration: float = 0.0
+    seed: Optional[int] = None
+
+    rng: random.Random = field(init=False, repr=False)
+    started_at: float = field(init=False, repr=False, default_factory=time.monotonic)
+
+    DISTRIBUTIONS = ("constant", "normal", "lognormal", "uniform")
+
+    def __post_init__(self):
+        if self.distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{self.distribution}', use one of {self.DISTRIBUTIONS}")
+
+        self.rng = random.Random(self.seed)
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "StubBehaviour":
+        """
+        Reads the settings from the environment variables with the given prefix, such as 'STUB_WEATHERAPI_LATENCY_MS',
+        falling back to the ones without it, such as 'STUB_LATENCY_MS', and then to the defaults
+        """
+        def setting(name: str, cast: type):
+            default = config(f"STUB_{name}", getattr(cls, name.lower()), cast=cast)
+            return config(f"STUB_{prefix}_{name}", default, cast=cast)
+
+        return cls(
+            latency_ms=setting("LATENCY_MS", float),
+            jitter_ms=setting("JITTER_MS", float),
+            distribution=setting("DISTRIBUTION", str),
+            error_rate=setting("ERROR_RATE", float),
+            burst_interval=setting("BURST_INTERVAL", float),
+            burst_duration=setting("BURST_DURATION", float),
+            seed=setting("SEED", lambda _: int(_) if _ not in (None, "") else None)
+        )
+
+    def delay(self) -> float:
+        """
+        Returns the number of seconds to wait before answering. For a 'normal' distribution, 'latency_ms' is its mean
+        and 'jitter_ms' its standard deviation. For a 'uniform' one, they're its center and half its width. For a
+        'lognormal' one, which has a long tail, 'latency_ms' is its median and the ratio 'jitter_ms / latency_ms' is
+        the standard deviation of its logarithm
+        """
+        latency, jitter = self.latency_ms / 1000, self.jitter_ms / 1000
+
+        if self.distribution == "constant":
+            return latency
+        if self.distribution == "normal":
+            return max(self.rng.gauss(latency, jitter), 0.0)
+        if self.distribution == "lognormal":
+            return latency * self.rng.lognormvariate(0, jitter / latency) if latency > 0 else 0.0
+
+        return max(self.rng.uniform(latency - jitter, latency + jitter), 0.0)
+
+    def failure(self) -> Optional[int]:
+        """
+        Returns the status code of the error to answer with, if any. During the first 'burst_duration' seconds of every
+        'burst_interval' seconds every request is answered with a 429 error, and otherwise 'error_rate' of them are
+        answered with a 503 error
+        """
+        if self.burst_interval > 0 and (time.monotonic() - self.started_at) % self.burst_interval < self.burst_duration:
+            return 429
+        if self.error_rate > 0 and self.rng.random() < self.error_rate:
+            return 503
+
+        return None
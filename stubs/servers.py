@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+from datetime import date, datetime, timedelta, timezone
+from importlib import resources
+from typing import Awaitable, Callable
+
+import numpy as np
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from .behaviour import StubBehaviour
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+WEATHER_DAYS = 7
+LIFE_EXPECTANCY_SEXES = ("Both Sexes", "Female", "Male")
+LIFE_EXPECTANCY_RACES = ("All Races", "Black", "White")
+LIFE_EXPECTANCY_YEARS = range(1900, 2019)
+TRENDS_PREFIX = ")]}'"
+
+
+def _behaving(behaviour: StubBehaviour, handler: Handler) -> Handler:
+    """Wraps a handler so that it answers after the behaviour's delay, or with one of its errors"""
+    async def endpoint(request: Request) -> Response:
+        await asyncio.sleep(behaviour.delay())
+
+        status_code = behaviour.failure()
+        if status_code is not None:
+            return Response(status_code=status_code)
+
+        return await handler(request)
+
+    return endpoint
+
+
+def _stub_app(behaviour: StubBehaviour, handlers: dict[str, Handler]) -> Starlette:
+    return Starlette(routes=[Route(path, _behaving(behaviour, handler)) for path, handler in handlers.items()])
+
+
+def weatherapi_app(behaviour: StubBehaviour) -> Starlette:
+    """Replays the recorded days of the weather API, picking one of them for each date"""
+    days = [
+        {suffix: resources.read_binary("test.resources.weather", f"day_{n}.{suffix}") for suffix in ("xml", "json")}
+        for n in range(WEATHER_DAYS)
+    ]
+
+    def history(suffix: str, media_type: str) -> Handler:
+        async def handler(request: Request) -> Response:
+            day = date.fromisoformat(request.query_params.get("dt", date.today().isoformat()))
+            return Response(days[day.toordinal() % WEATHER_DAYS][suffix], media_type=media_type)
+
+        return handler
+
+    return _stub_app(behaviour, {
+        "/history.xml": history("xml", "application/xml"),
+        "/history.json": history("json", "application/json"),
+    })
+
+
+def ipregistry_app(behaviour: StubBehaviour) -> Starlette:
+    """Locates every IP in Valencia, Spain"""
+    async def lookup(request: Request) -> Response:
+        ip = request.path_params.get("ip", "")
+        return JSONResponse({"ip": ip, "location": {"latitude": 39.4697, "longitude": -0.3774}})
+
+    return _stub_app(behaviour, {"/": lookup, "/{ip}": lookup})
+
+
+def bls_app(behaviour: StubBehaviour) -> Starlette:
+    """Replays the recorded BLS page at any path, answering conditional requests as the real server does"""
+    page = resources.read_binary("test.resources", "unemployment.html")
+    etag = f'"{hashlib.sha256(page).hexdigest()[:16]}"'
+
+    async def unemployment(request: Request) -> Response:
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        return Response(page, media_type="text/html", headers={"ETag": etag})
+
+    return _stub_app(behaviour, {"/{path:path}": unemployment})
+
+
+def cdc_app(behaviour: StubBehaviour) -> Starlette:
+    """Generates the life expectancy dataset of the CDC API, answering both single queries and whole downloads"""
+    rows = [
+        {"year": str(year), "race": race, "sex": sex,
+         "average_life_expectancy": f"{47 + (year - 1900) * 0.25 + 3 * (sex == 'Female') - 5 * (race == 'Black'):.1f}"}
+        for year in LIFE_EXPECTANCY_YEARS for race in LIFE_EXPECTANCY_RACES for sex in LIFE_EXPECTANCY_SEXES
+    ]
+
+    async def life_expectancy(request: Request) -> Response:
+        filters = {name: request.query_params[name] for name in ("year", "race", "sex") if name in request.query_params}
+        limit = int(request.query_params.get("$limit", 1000))
+
+        return JSONResponse([row for row in rows if filters.items() <= row.items()][:limit])
+
+    return _stub_app(behaviour, {"/resource/w9j2-ggv5.json": life_expectancy})
+
+
+def trends_app(behaviour: StubBehaviour) -> Starlette:
+    """
+    Generates the daily interest of Google Trends for the endpoints that 'pytrends' calls to build an interest over
+    time query. The interest of each phrase is random, but always the same for the same phrase and dates
+    """
+    def trends_response(content: dict, prefix: str) -> Response:
+        return Response(prefix + json.dumps(content), media_type="application/json")
+
+    async def home(_: Request) -> Response:
+        return Response("", media_type="text/html")
+
+    async def explore(request: Request) -> Response:
+        widget_request = json.loads(request.query_params["req"])
+        widget = {"id": "TIMESERIES", "token": "stub", "request": widget_request}
+
+        return trends_response({"widgets": [widget]}, TRENDS_PREFIX)
+
+    async def interest_over_time(request: Request) -> Response:
+        comparison_items = json.loads(request.query_params["req"])["comparisonItem"]
+        start_date, end_date = (date.fromisoformat(_) for _ in comparison_items[0]["time"].split())
+        days = [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+
+        interests = np.column_stack([
+            np.random.default_rng(int.from_bytes(hashlib.sha256(_["keyword"].encode()).digest()[:8], "little") +
+                                  start_date.toordinal()).integers(0, 101, len(days))
+            for _ in comparison_items
+        ])
+
+        timeline = [
+            {"time": str(int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())),
+             "formattedTime": day.strftime("%b %-d, %Y"), "value": values.tolist(),
+             "hasData": [True] * len(values), "formattedValue": [str(_) for _ in values]}
+            for day, values in zip(days, interests)
+        ]
+
+        return trends_response({"default": {"timelineData": timeline, "averages": []}}, TRENDS_PREFIX + ",")
+
+    return _stub_app(behaviour, {
+        "/": home,
+        "/api/explore": explore,
+        "/api/widgetdata/multiline": interest_over_time,
+    })
+
+
+# Each stub with its default port
+STUBS: dict[str, tuple[Callable[[StubBehaviour], Starlette], int]] = {
+    "weatherapi": (weatherapi_app, 9001),
+    "ipregistry": (ipregistry_app, 9002),
+    "bls": (bls_app, 9003),
+    "cdc": (cdc_app, 9004),
+    "trends": (trends_app, 9005),
+}
+
+
+def build_app(name: str, behaviour: StubBehaviour) -> Starlette:
+    factory, _ = STUBS[name]
+    return factory(behaviour)
@@ -0,0 +1,29 @@
+import asyncio
+import contextlib
+from typing import Iterable
+
+from starlette.routing import BaseRoute
+
+from utils.watchdog import LoopWatchdog, Stall
+
+
+@contextlib.asynccontextmanager
+async def loop_must_not_block(max_ms: float, routes: Iterable[BaseRoute] = ()):
+    """
+    Fails the test if the asyncio loop is blocked for longer than 'max_ms' milliseconds within the block, e.g.:
+
+        async with loop_must_not_block(50, app.routes):
+            await client.get("/weather")
+    """
+    stalls: list[Stall] = []
+    watchdog = LoopWatchdog(max_ms / 1000, routes, on_stall=stalls.append)
+    watchdog.start()
+
+    try:
+        yield
+        # Lets the loop beat once more, so that a stall at the end of the block is reported too
+        await asyncio.sleep(watchdog.interval)
+    finally:
+        watchdog.stop()
+
+    assert not stalls, "\n".join(str(_) for _ in stalls)
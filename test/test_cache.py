@@ -0,0 +1,48 @@
+from utils.cache import LRUCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats().evictions == 1
+
+
+def test_entry_expires_after_its_ttl():
+    timer = FakeTimer()
+    cache = LRUCache(max_size=2, timer=timer)
+    cache.set("today", 1, ttl=10)
+    cache.set("yesterday", 2)
+
+    timer.now = 11
+
+    assert cache.get("today") is None
+    assert cache.get("yesterday") == 2
+    assert (cache.stats().hits, cache.stats().misses) == (1, 1)
+
+
+def test_stale_reads_only_count_as_stale_hits():
+    timer = FakeTimer()
+    cache = LRUCache(max_size=2, ttl=10, timer=timer)
+    cache.set("today", 1)
+
+    timer.now = 11
+
+    assert cache.get("today") is None
+    assert cache.get("today", stale=True) == 1
+    assert cache.get("tomorrow", stale=True) is None
+    assert (cache.stats().hits, cache.stats().misses, cache.stats().stale_hits) == (0, 1, 1)
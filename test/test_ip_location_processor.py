@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+import respx
+from httpx import Response
+
+from processor import IpLocationProcessor
+
+LOCATION_RESPONSE = {"ip": "80.13.0.1", "location": {"latitude": 39.46, "longitude": -0.36}}
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_concurrent_lookups_for_the_same_ip_send_a_single_request():
+    url = "http://localhost"
+    processor = IpLocationProcessor(url, "")
+
+    async def delayed_response(_):
+        await asyncio.sleep(0.01)
+        return Response(200, json=LOCATION_RESPONSE)
+
+    route = respx.get(f"{url}/80.13.0.1?key=").mock(side_effect=delayed_response)
+
+    results = await asyncio.gather(*[processor.get("80.13.0.1") for _ in range(5)])
+    cached_result = await processor.get("80.13.0.1")
+
+    assert results == ["39.46,-0.36"] * 5
+    assert cached_result == "39.46,-0.36"
+    assert route.call_count == 1
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_ips_in_the_same_network_share_the_location_when_enabled():
+    url = "http://localhost"
+    processor = IpLocationProcessor(url, "", share_prefix=True)
+
+    route = respx.get(f"{url}/80.13.0.1?key=").mock(return_value=Response(200, json=LOCATION_RESPONSE))
+
+    await processor.get("80.13.0.1")
+    result = await processor.get("80.13.0.254")
+
+    assert result == "39.46,-0.36"
+    assert route.call_count == 1
@@ -1,9 +1,12 @@
+import asyncio
+
 import respx
 import pytest
 from httpx import Response
 
-from model import SexType, RaceType, LifeExpectancy
+from model import SexType, RaceType, LifeExpectancy, AppException
 from processor import LifeExpectancyProcessor
+from utils.resilience import Resilience, BreakerState
 
 
 def _build_url(base_url: str, sex: SexType, race: RaceType, year: int):
@@ -23,3 +26,93 @@ async def test_get_life_expectancy_for_white_men_in_1990():
 
     result = await processor.get(sex, race, year)
     assert result == LifeExpectancy(70)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_preloaded_life_expectancy_is_answered_from_memory():
+    url = "http://localhost"
+    processor = LifeExpectancyProcessor(url, preload=True)
+
+    dataset = [
+        {"sex": "Female", "race": "White", "year": "1998", "average_life_expectancy": "80"},
+        {"sex": "Male", "race": "White", "year": "1998", "average_life_expectancy": "74.5"}
+    ]
+    dataset_route = respx.get(url + LifeExpectancyProcessor.ENDPOINT, params={"$limit": "50000"}).mock(
+        return_value=Response(200, json=dataset)
+    )
+    query_route = respx.get(_build_url(url, SexType.female, RaceType.black, 1998)).mock(
+        return_value=Response(200, json=[{"average_life_expectancy": 74.8}])
+    )
+
+    await processor.async_setup()
+    preloaded_result = await processor.get(SexType.female, RaceType.white, 1998)
+    missing_result = await processor.get(SexType.female, RaceType.black, 1998)
+    await processor.async_teardown()
+
+    assert preloaded_result == LifeExpectancy(80)
+    assert missing_result == LifeExpectancy(74.8)
+    assert (dataset_route.call_count, query_route.call_count) == (1, 1)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_a_single_query():
+    url = "http://localhost"
+    processor = LifeExpectancyProcessor(url)
+    sex, race, year = SexType.male, RaceType.white, 1980
+
+    async def delayed_response(_):
+        await asyncio.sleep(0.01)
+        return Response(200, json=[{"average_life_expectancy": 70.7}])
+
+    route = respx.get(_build_url(url, sex, race, year)).mock(side_effect=delayed_response)
+
+    results = await asyncio.gather(*[processor.get(sex, race, year) for _ in range(5)])
+
+    assert results == [LifeExpectancy(70.7)] * 5
+    assert route.call_count == 1
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_shared_query_survives_the_cancellation_of_its_first_caller():
+    url = "http://localhost"
+    processor = LifeExpectancyProcessor(url)
+    sex, race, year = SexType.male, RaceType.white, 1980
+
+    async def delayed_response(_):
+        await asyncio.sleep(0.05)
+        return Response(200, json=[{"average_life_expectancy": 70.7}])
+
+    route = respx.get(_build_url(url, sex, race, year)).mock(side_effect=delayed_response)
+
+    first_caller = asyncio.create_task(processor.get(sex, race, year))
+    second_caller = asyncio.create_task(processor.get(sex, race, year))
+    await asyncio.sleep(0.01)
+    first_caller.cancel()
+
+    assert await second_caller == LifeExpectancy(70.7)
+    assert first_caller.cancelled()
+    assert route.call_count == 1
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_years_without_data_are_not_found_and_dont_open_the_breaker():
+    url = "http://localhost"
+    processor = LifeExpectancyProcessor(url, resilience=Resilience("cdc-test", failure_threshold=2))
+    sex, race = SexType.male, RaceType.white
+
+    _ = respx.get(_build_url(url, sex, race, 3000)).mock(return_value=Response(200, json=[]))
+    _ = respx.get(_build_url(url, sex, race, 2000)).mock(
+        return_value=Response(200, json=[{"average_life_expectancy": 74.7}])
+    )
+
+    for _ in range(3):
+        with pytest.raises(AppException) as error:
+            await processor.get(sex, race, 3000)
+        assert error.value.status == 404
+
+    assert processor.resilience.breaker.state == BreakerState.CLOSED
+    assert await processor.get(sex, race, 2000) == LifeExpectancy(74.7)
@@ -1,10 +1,11 @@
+import os
 import random
 from datetime import date
 
 import us
 from locust import HttpUser, task, between
 
-from multiapi.model import SexType, RaceType
+from model import SexType, RaceType
 
 STATES_SHORTCODES = [_.abbr for _ in us.STATES]
 
@@ -37,7 +38,7 @@ def random_date_range() -> (date, date):
 
 
 class TestLoadUser(HttpUser):
-    wait_time = between(1, 10)
+    wait_time = between(float(os.getenv("LOAD_TEST_MIN_WAIT", 1)), float(os.getenv("LOAD_TEST_MAX_WAIT", 10)))
 
     @task(2)
     def test_life_expectancy(self):
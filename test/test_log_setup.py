@@ -0,0 +1,80 @@
+import io
+import json
+import logging
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from utils.log_setup import setup_logging, stop_logging, parse_sample_rates, DeferredQueueHandler, \
+    RequestContextMiddleware
+
+
+@pytest.fixture
+def log_stream(monkeypatch) -> io.StringIO:
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    stream = io.StringIO()
+    setup_logging(stream)
+
+    yield stream
+
+    stop_logging()
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware, sample_rates=parse_sample_rates("/quiet=0"))
+
+    @app.get("/loud")
+    async def loud_handler():
+        logging.info("Answering %s", "loudly")
+        return "OK"
+
+    @app.get("/quiet")
+    async def quiet_handler():
+        logging.info("Answering %s", "quietly")
+        logging.warning("Warned %s", "quietly")
+        return "OK"
+
+    return app
+
+
+def records(stream: io.StringIO) -> list[dict]:
+    stop_logging()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+@pytest.mark.asyncio
+async def test_records_are_written_with_the_id_of_their_request(log_stream: io.StringIO):
+    async with httpx.AsyncClient(app=build_app(), base_url="http://test") as client:
+        response = await client.get("/loud", headers={"X-Request-ID": "abc"})
+        generated_id_response = await client.get("/loud")
+
+    entries = records(log_stream)
+
+    assert response.headers["X-Request-ID"] == "abc"
+    assert [(_["message"], _["request_id"], _["route"]) for _ in entries] == [
+        ("Answering loudly", "abc", "/loud"),
+        ("Answering loudly", generated_id_response.headers["X-Request-ID"], "/loud"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_only_warnings_are_written_for_routes_not_sampled(log_stream: io.StringIO):
+    async with httpx.AsyncClient(app=build_app(), base_url="http://test") as client:
+        await client.get("/quiet")
+
+    assert [(_["level"], _["message"]) for _ in records(log_stream)] == [("WARNING", "Warned quietly")]
+
+
+def test_sample_rates_are_parsed_by_route():
+    assert parse_sample_rates("") == {}
+    assert parse_sample_rates("/health=0, /unemployment/{state}=0.25") == {"/health": 0.0,
+                                                                           "/unemployment/{state}": 0.25}
+
+
+def test_queue_handler_is_removed_when_logging_stops():
+    setup_logging(io.StringIO())
+    stop_logging()
+
+    assert not [_ for _ in logging.getLogger().handlers if isinstance(_, DeferredQueueHandler)]
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+import respx
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+
+from utils.metrics import MetricsMiddleware, RuntimeMonitor
+from utils.upstream import UpstreamClients, UpstreamConfig
+
+
+def sample(name: str, labels: dict) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_requests_are_labelled_with_their_route():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item_handler(item_id: int):
+        return item_id
+
+    labels = {"route": "/items/{item_id}", "method": "GET", "status": "200"}
+    before = sample("multiapi_request_duration_seconds_count", labels)
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        responses = [await client.get(f"/items/{n}") for n in range(3)]
+
+    assert [_.json() for _ in responses] == [0, 1, 2]
+    assert sample("multiapi_request_duration_seconds_count", labels) == before + 3
+    assert sample("multiapi_requests_in_progress", {"route": "/items/{item_id}", "method": "GET"}) == 0
+
+
+@pytest.mark.asyncio
+async def test_upstream_requests_are_labelled_with_their_status():
+    upstreams = UpstreamClients()
+    upstreams.register("metered", "http://metered.test", UpstreamConfig())
+
+    labels = {"upstream": "metered", "status": "503"}
+    before = sample("multiapi_upstream_request_duration_seconds_count", labels)
+
+    with respx.mock:
+        respx.get("http://metered.test/").mock(return_value=httpx.Response(503))
+        await upstreams.async_client("metered").get("/")
+        upstreams.client("metered").get("/")
+
+    await upstreams.aclose()
+    assert sample("multiapi_upstream_request_duration_seconds_count", labels) == before + 2
+
+
+@pytest.mark.asyncio
+async def test_blocking_the_loop_is_observed_as_lag():
+    before = sample("multiapi_event_loop_lag_seconds_sum", {})
+
+    monitor = RuntimeMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.02)
+    time.sleep(0.1)
+    await asyncio.sleep(0.02)
+    await monitor.stop()
+
+    assert sample("multiapi_event_loop_lag_seconds_sum", {}) - before >= 0.08
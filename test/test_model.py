@@ -0,0 +1,72 @@
+import json
+import re
+
+import pytest
+
+from model import TrendsAndWeather, Weather, WeatherDay, PhraseTrends, PhraseTrendDay, TrendsPeriod, USState, \
+    _is_a_us_state
+
+
+def _weather_day(date: str) -> WeatherDay:
+    return WeatherDay(date, 21.8, 13.1, 18.3, 15.8, 0.0, 66.0, "Cloudy", 0, "07:21 AM", "08:42 PM")
+
+
+def test_trends_and_weather_are_joined_by_date():
+    weather = Weather([_weather_day("2022-04-18"), _weather_day("2022-04-17"), _weather_day("2022-04-16")])
+    interests = PhraseTrends.of([PhraseTrendDay("2022-04-16", 100), PhraseTrendDay("2022-04-17", 50)])
+
+    result = TrendsAndWeather(weather, interests).to_json()
+
+    assert [(_["date"], _["interest"]) for _ in result] == [("2022-04-17", 50), ("2022-04-16", 100)]
+    assert result[0]["weather"]["forecast"] == "Cloudy"
+
+
+def test_us_states_are_looked_up_by_alpha_code():
+    assert _is_a_us_state("FL") and _is_a_us_state("ny") and _is_a_us_state("DC")
+    assert not _is_a_us_state("XX") and not _is_a_us_state("Florida") and not _is_a_us_state(12)
+    assert USState.of("fl") == "Florida"
+
+
+def test_json_bytes_match_the_json_dicts():
+    weather = Weather([_weather_day("2022-04-18"), _weather_day("2022-04-17"), _weather_day("2022-04-16")])
+    interests = PhraseTrends.of([PhraseTrendDay("2022-04-16", 100), PhraseTrendDay("2022-04-17", 50)])
+    trends_and_weather = TrendsAndWeather(weather, interests)
+
+    assert json.loads(trends_and_weather.to_json_bytes()) == trends_and_weather.to_json()
+    assert json.loads(weather.to_json_bytes()) == weather.items()
+    assert json.loads(TrendsAndWeather(weather, PhraseTrends.of([])).to_json_bytes()) == []
+
+
+def test_weather_days_are_formatted_once():
+    weather_day = _weather_day("2022-04-18")
+
+    assert weather_day.json_fields() is weather_day.json_fields()
+    assert weather_day == _weather_day("2022-04-18")
+
+
+def test_phrase_trends_are_resampled_and_aggregated():
+    interests = PhraseTrends.of([PhraseTrendDay(f"2022-04-{day:02}", day * 10) for day in range(1, 12)])
+
+    weekly = interests.resample(TrendsPeriod.week)
+    assert weekly.to_json(with_dates=True) == {"dates": ["2022-03-28", "2022-04-04", "2022-04-11"],
+                                               "interest": [20.0, 70.0, 110.0]}
+    assert interests.resample(TrendsPeriod.month).to_json() == {"interest": [60.0]}
+
+    assert interests.rolling(3).to_json(with_dates=True)["dates"][0] == "2022-04-03"
+    assert interests.rolling(3).to_json()["interest"][:2] == [20.0, 30.0]
+    assert interests.rolling(20).to_json() == {"interest": []}
+
+    assert interests.aggregate("max") == 110
+    assert interests.aggregate("median") == 60
+    assert interests.aggregate("p90") == 100
+    assert PhraseTrends.of([]).aggregate("mean") is None
+
+
+@pytest.mark.parametrize("agg", ["p100.5", "p101", "p-1", "p", "average"])
+def test_invalid_aggregations_are_rejected(agg):
+    assert re.match(PhraseTrends.AGGREGATE_PATTERN, agg) is None
+
+
+@pytest.mark.parametrize("agg", ["p0", "p99.9", "p100", "p100.0", "mean"])
+def test_valid_aggregations_are_accepted(agg):
+    assert re.match(PhraseTrends.AGGREGATE_PATTERN, agg) is not None
@@ -0,0 +1,110 @@
+import asyncio
+
+import httpx
+import pytest
+import respx
+from prometheus_client import REGISTRY
+
+from model import AppException
+from processor import IpLocationProcessor
+from utils.resilience import Resilience, BreakerState
+
+
+class FakeTimer:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def failing_call():
+    raise httpx.ConnectError("Connection refused")
+
+
+async def succeeding_call():
+    return "OK"
+
+
+@pytest.mark.asyncio
+async def test_breaker_fails_fast_after_consecutive_failures_until_a_trial_call_succeeds():
+    timer = FakeTimer()
+    resilience = Resilience("flaky", failure_threshold=2, recovery_time=10, timer=timer)
+
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            await resilience.call(failing_call)
+
+    with pytest.raises(AppException) as error:
+        await resilience.call(succeeding_call)
+    assert (resilience.breaker.state, error.value.status) == (BreakerState.OPEN, 503)
+    assert await resilience.call(succeeding_call, lambda: "cached") == "cached"
+
+    timer.now = 10
+    assert await resilience.call(succeeding_call) == "OK"
+    assert resilience.breaker.state == BreakerState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_client_errors_dont_open_the_breaker():
+    async def not_found():
+        request = httpx.Request("GET", "http://test")
+        raise httpx.HTTPStatusError("Not found", request=request, response=httpx.Response(404, request=request))
+
+    resilience = Resilience("strict", failure_threshold=1)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await resilience.call(not_found)
+    assert resilience.breaker.state == BreakerState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_calls_missing_their_deadline_are_cancelled():
+    async def slow_call():
+        await asyncio.sleep(1)
+
+    resilience = Resilience("slow", deadline=0.01)
+
+    with pytest.raises(AppException) as error:
+        await resilience.call(slow_call)
+    assert error.value.status == 504
+    assert await resilience.call(slow_call, lambda: "cached") == "cached"
+
+
+@pytest.mark.asyncio
+async def test_slow_calls_are_hedged_after_the_latency_quantile():
+    resilience = Resilience("hedged", hedge=True, hedge_quantile=0.95)
+    resilience.latencies.extend([0.01] * Resilience.MIN_HEDGE_SAMPLES)
+    delays = iter([1, 0])
+
+    async def first_call_is_slow():
+        await asyncio.sleep(next(delays))
+        return "OK"
+
+    wins = REGISTRY.get_sample_value("multiapi_hedged_request_wins_total", {"upstream": "hedged"}) or 0.0
+
+    assert await asyncio.wait_for(resilience.call(first_call_is_slow), 0.5) == "OK"
+    assert REGISTRY.get_sample_value("multiapi_hedged_request_wins_total", {"upstream": "hedged"}) == wins + 1
+
+
+@pytest.mark.asyncio
+async def test_expired_location_is_returned_while_the_breaker_is_open():
+    timer = FakeTimer()
+    processor = IpLocationProcessor("http://ipregistry.test", "", ttl=60,
+                                    resilience=Resilience("ipregistry", failure_threshold=1, timer=timer))
+    processor.cache.timer = timer
+
+    with respx.mock:
+        respx.get("http://ipregistry.test/1.1.1.1").mock(side_effect=[
+            httpx.Response(200, json={"location": {"latitude": 1, "longitude": 2}}),
+            httpx.Response(503),
+        ])
+
+        assert await processor.get("1.1.1.1") == "1,2"
+        timer.now = 61
+        with pytest.raises(httpx.HTTPStatusError):
+            await processor.get("1.1.1.1")
+        assert await processor.get("1.1.1.1") == "1,2"
+
+    await processor.async_teardown()
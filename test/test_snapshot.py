@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from utils.snapshot import SnapshotReader, write_snapshot
+
+
+def test_reader_switches_to_the_new_snapshot_version(tmp_path):
+    path = str(tmp_path / "rates.snapshot")
+    reader = SnapshotReader(path, check_interval=0)
+
+    assert len(reader) == 0
+
+    first_version = write_snapshot(path, {"Florida": 3.3, "New York": 4.6}, datetime(2022, 4, 15))
+    assert (reader.version, reader["Florida"], reader.update_date) == (first_version, 3.3, datetime(2022, 4, 15))
+
+    second_version = write_snapshot(path, {"Florida": 3.1}, datetime(2022, 5, 15))
+    assert reader.version == second_version > first_version
+    assert dict(reader) == {"Florida": 3.1}
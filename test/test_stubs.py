@@ -0,0 +1,40 @@
+import socket
+import threading
+import time
+from datetime import datetime
+
+import uvicorn
+
+from model import PhraseTrends
+from processor import TrendsProcessor
+from stubs import StubBehaviour, build_app
+
+
+def test_stub_answers_with_429_during_bursts():
+    behaviour = StubBehaviour(latency_ms=0, burst_interval=3600, burst_duration=1800)
+    assert behaviour.failure() == 429
+
+    behaviour = StubBehaviour(latency_ms=0, distribution="constant", error_rate=1.0)
+    assert behaviour.failure() == 503 and behaviour.delay() == 0
+
+
+def test_trends_processor_queries_the_trends_stub():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    stub = build_app("trends", StubBehaviour(latency_ms=0, distribution="constant"))
+    server = uvicorn.Server(uvicorn.Config(stub, log_level="warning"))
+    threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True).start()
+
+    while not server.started:
+        time.sleep(0.01)
+
+    processor = TrendsProcessor(url=f"http://127.0.0.1:{sock.getsockname()[1]}", max_workers=1)
+    try:
+        result = processor.get("illo", datetime(2022, 1, 1), datetime(2022, 1, 10))
+        repeated_result = processor.get("illo", datetime(2022, 1, 1), datetime(2022, 1, 10))
+    finally:
+        processor.teardown()
+        server.should_exit = True
+
+    assert isinstance(result, PhraseTrends) and len(result.interest) == 10
+    assert result == repeated_result
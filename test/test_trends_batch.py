@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from processor.trends_batch import TrendsBatcher
+
+TIMEFRAME = "2022-01-01 2022-01-03"
+
+
+def test_concurrent_phrases_are_sent_in_a_single_query_and_rescaled():
+    queries = []
+
+    def query(phrases: list[str], timeframe: str) -> pd.DataFrame:
+        queries.append((sorted(phrases), timeframe))
+        return pd.DataFrame(
+            {"bitcoin": [100, 50, 80], "ethereum": [10, 25, 5]},
+            index=pd.date_range("2022-01-01", periods=3)
+        )
+
+    batcher = TrendsBatcher(query, window=0.5)
+
+    with ThreadPoolExecutor(2) as executor:
+        bitcoin = executor.submit(batcher.get, "bitcoin", TIMEFRAME)
+        ethereum = executor.submit(batcher.get, "ethereum", TIMEFRAME)
+
+        assert bitcoin.result().tolist() == [100, 50, 80]
+        assert ethereum.result().tolist() == [40, 100, 20]
+
+    assert queries == [(["bitcoin", "ethereum"], TIMEFRAME)]
@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+
+import pandas as pd
+
+from processor.trends_cache import TrendsDayCache
+
+POPULARITY = {date(2021, 1, 1) + timedelta(days=n): 10 + (n * 7) % 23 for n in range(31)}
+
+
+def _fetch_normalized(fetched_ranges: list):
+    def fetch(_: str, start_date: date, end_date: date) -> pd.Series:
+        fetched_ranges.append((start_date, end_date))
+        days = [day for day in POPULARITY if start_date <= day <= end_date]
+        values = pd.Series([POPULARITY[day] for day in days], index=pd.DatetimeIndex(days))
+        return (values * 100 / values.max()).round().astype(int)
+
+    return fetch
+
+
+def test_only_missing_days_are_fetched_and_normalized_as_a_single_query():
+    fetched_ranges = []
+    cache = TrendsDayCache(_fetch_normalized(fetched_ranges), today=lambda: date(2022, 1, 1))
+    expected = _fetch_normalized([])
+
+    cache.get("bitcoin", date(2021, 1, 1), date(2021, 1, 10))
+    extended_result = cache.get("bitcoin", date(2021, 1, 5), date(2021, 1, 15))
+    cached_result = cache.get("bitcoin", date(2021, 1, 3), date(2021, 1, 7))
+
+    assert fetched_ranges == [(date(2021, 1, 1), date(2021, 1, 10)), (date(2021, 1, 8), date(2021, 1, 15))]
+    for result, (start, end) in [(extended_result, (5, 15)), (cached_result, (3, 7))]:
+        expected_result = expected("bitcoin", date(2021, 1, start), date(2021, 1, end))
+        assert (result - expected_result).abs().max() <= 1
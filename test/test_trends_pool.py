@@ -0,0 +1,36 @@
+import pytest
+from prometheus_client import REGISTRY
+from pytrends.exceptions import TooManyRequestsError
+
+from processor.trends_pool import TrendReqPool
+
+
+class FakeSession:
+    pass
+
+
+def test_sessions_are_reused_and_recycled_after_a_429_error():
+    created_sessions = []
+
+    def factory() -> FakeSession:
+        created_sessions.append(FakeSession())
+        return created_sessions[-1]
+
+    pool = TrendReqPool(size=1, factory=factory)
+    waits = REGISTRY.get_sample_value("multiapi_trends_session_wait_seconds_count") or 0.0
+
+    with pool.session() as first_session:
+        pass
+    with pool.session() as second_session:
+        assert second_session is first_session
+
+    with pytest.raises(TooManyRequestsError):
+        with pool.session():
+            raise TooManyRequestsError("Too many requests", None)
+
+    with pool.session() as third_session:
+        assert third_session is not first_session
+
+    assert len(created_sessions) == 2
+    assert (pool.stats().checkouts, pool.stats().recycled) == (4, 1)
+    assert REGISTRY.get_sample_value("multiapi_trends_session_wait_seconds_count") == waits + 4
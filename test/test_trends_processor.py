@@ -42,4 +42,4 @@ def test_get_trends_for_a_single_day():
                   body=raw_response, content_type="application/json")
 
     result = processor.get(phrase, start, end)
-    assert result == PhraseTrends([PhraseTrendDay('2022-01-01', 100)])
+    assert result == PhraseTrends.of([PhraseTrendDay('2022-01-01', 100)])
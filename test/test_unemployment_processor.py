@@ -1,9 +1,13 @@
+import json
+import time
+from dataclasses import asdict
 from importlib import resources
 
+import pytest
 import respx
 from httpx import Response
 
-from model import UnemploymentRate
+from model import UnemploymentRate, AppException
 from processor import UnemploymentProcessor
 
 SAMPLE_DATA = resources.read_text("test.resources", "unemployment.html")
@@ -19,3 +23,194 @@ def test_get_unemployment_for_florida():
 
     result = processor.get("FL")
     assert result == UnemploymentRate(3.3)
+
+
+@respx.mock
+def test_response_bodies_are_rendered_again_when_the_rates_change():
+    url = "http://localhost"
+    processor = UnemploymentProcessor(url, update_frequency=1)
+
+    updated_data = SAMPLE_DATA.replace('<span class="datavalue">3.3</span>', '<span class="datavalue">9.9</span>', 1)
+    _ = respx.get(url).mock(side_effect=[Response(200, html=SAMPLE_DATA), Response(200, html=updated_data)])
+
+    body = processor.get_json("FL")
+    assert body is processor.get_json("FL")
+
+    processor.refresh()
+
+    assert json.loads(body) == asdict(UnemploymentRate(3.3))
+    assert json.loads(processor.get_json("FL")) == asdict(UnemploymentRate(9.9))
+
+
+@respx.mock
+def test_failed_refresh_keeps_serving_the_stale_rates():
+    url = "http://localhost"
+    processor = UnemploymentProcessor(url, update_frequency=1)
+
+    route = respx.get(url).mock(side_effect=[Response(200, html=SAMPLE_DATA), Response(503)])
+
+    processor.refresh()
+    assert not processor.is_stale
+
+    processor.refresh()
+    result = processor.get("FL")
+
+    assert result == UnemploymentRate(3.3)
+    assert processor.is_stale
+    assert route.call_count == 2
+
+
+@respx.mock
+def test_failed_refresh_is_not_retried_by_every_request_until_the_retry_interval():
+    url = "http://localhost"
+    processor = UnemploymentProcessor(url, update_frequency=1, retry_interval=60)
+
+    route = respx.get(url).mock(return_value=Response(503))
+
+    for _ in range(3):
+        with pytest.raises(AppException) as error:
+            processor.get_json("FL")
+        assert error.value.status == 503
+
+    assert route.call_count == 1
+
+
+@respx.mock
+def test_failed_refresh_is_retried_in_the_background():
+    url = "http://localhost"
+    processor = UnemploymentProcessor(url, update_frequency=1, retry_interval=0.05)
+
+    route = respx.get(url).mock(side_effect=[Response(503), Response(200, html=SAMPLE_DATA)])
+
+    processor.setup()
+    time.sleep(0.5)
+    processor.teardown()
+
+    assert processor.get("FL") == UnemploymentRate(3.3)
+    assert route.call_count == 2
+    with pytest.raises(AppException) as error:
+        processor.get("ZZ")
+    assert error.value.status == 400
+
+
+@respx.mock
+def test_only_the_first_process_fetches_the_shared_snapshot(tmp_path):
+    url, snapshot_path = "http://localhost", str(tmp_path / "unemployment.snapshot")
+    fetcher = UnemploymentProcessor(url, update_frequency=1, snapshot_path=snapshot_path)
+    reader = UnemploymentProcessor(url, update_frequency=1, snapshot_path=snapshot_path)
+
+    route = respx.get(url).mock(return_value=Response(200, html=SAMPLE_DATA))
+
+    fetcher.setup()
+    reader.setup()
+    result = reader.get("FL")
+
+    fetcher.teardown()
+    reader.teardown()
+
+    assert result == UnemploymentRate(3.3)
+    assert reader.last_update_date == fetcher.last_update_date
+    assert route.call_count == 1
+
+
+@respx.mock
+def test_other_processes_never_fetch_nor_write_the_shared_snapshot(tmp_path):
+    url, snapshot_path = "http://localhost", str(tmp_path / "unemployment.snapshot")
+    fetcher = UnemploymentProcessor(url, update_frequency=1, snapshot_path=snapshot_path)
+    reader = UnemploymentProcessor(url, update_frequency=1, snapshot_path=snapshot_path, snapshot_timeout=0.2)
+
+    route = respx.get(url).mock(return_value=Response(200, html=SAMPLE_DATA))
+
+    assert fetcher.acquire_fetcher_lock()
+    reader.setup()
+    reader.refresh()
+
+    with pytest.raises(AppException) as error:
+        reader.get_json("FL")
+
+    start = time.monotonic()
+    with pytest.raises(AppException):
+        reader.get_json("FL")
+    retry_seconds = time.monotonic() - start
+
+    fetcher.teardown()
+    reader.teardown()
+
+    assert error.value.status == 503
+    assert retry_seconds < 0.1
+    assert route.call_count == 0
+    assert not (tmp_path / "unemployment.snapshot").exists()
+
+
+@respx.mock
+def test_another_process_takes_over_when_the_fetcher_exits(tmp_path):
+    url, snapshot_path = "http://localhost", str(tmp_path / "unemployment.snapshot")
+    fetcher = UnemploymentProcessor(url, update_frequency=1, snapshot_path=snapshot_path)
+    reader = UnemploymentProcessor(url, update_frequency=1, snapshot_path=snapshot_path, retry_interval=0.05)
+
+    route = respx.get(url).mock(return_value=Response(200, html=SAMPLE_DATA))
+
+    assert fetcher.acquire_fetcher_lock()
+    reader.setup()
+    fetcher.teardown()
+    time.sleep(0.5)
+
+    result = reader.get("FL")
+    reader.teardown()
+
+    assert reader.is_fetcher
+    assert result == UnemploymentRate(3.3)
+    assert route.call_count == 1
+
+
+@respx.mock
+def test_unchanged_page_is_not_parsed_again():
+    url = "http://localhost"
+    processor = UnemploymentProcessor(url, update_frequency=1)
+
+    route = respx.get(url).mock(side_effect=[
+        Response(200, html=SAMPLE_DATA, headers={"ETag": '"v1"', "Last-Modified": "Fri, 15 Apr 2022 12:00:00 GMT"}),
+        Response(304)
+    ])
+
+    processor.refresh()
+    first_store = processor.store
+    processor.refresh()
+
+    assert route.calls.last.request.headers["If-None-Match"] == '"v1"'
+    assert route.calls.last.request.headers["If-Modified-Since"] == "Fri, 15 Apr 2022 12:00:00 GMT"
+    assert processor.store is first_store
+    assert not processor.is_stale
+
+
+@respx.mock
+def test_page_without_validators_is_not_parsed_again_if_its_content_is_the_same():
+    url = "http://localhost"
+    processor = UnemploymentProcessor(url, update_frequency=1)
+
+    route = respx.get(url).mock(return_value=Response(200, html=SAMPLE_DATA))
+
+    processor.refresh()
+    first_store = processor.store
+    processor.refresh()
+
+    assert "If-None-Match" not in route.calls.last.request.headers
+    assert processor.store is first_store
+
+
+def test_table_only_parser_matches_the_whole_tree_parser():
+    processor = UnemploymentProcessor("http://localhost")
+
+    rates, update_date = processor.parse_page_stream(SAMPLE_DATA)
+
+    assert rates == processor.parse_page_tree(SAMPLE_DATA)
+    assert update_date == processor.last_update_date
+
+
+def test_whole_tree_is_parsed_when_the_table_cannot_be_found_in_the_page():
+    processor = UnemploymentProcessor("http://localhost")
+    page = SAMPLE_DATA.replace('id="lauhsthl"', "id='lauhsthl'")
+
+    rates = processor.parse_page(page)
+
+    assert rates["FL"] == 3.3
@@ -0,0 +1,47 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.upstream import UpstreamClients, UpstreamConfig
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"OK")
+
+    def log_message(self, *_):
+        pass
+
+
+def test_connections_are_reused_between_requests():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    upstreams = UpstreamClients()
+    upstreams.register("local", f"http://127.0.0.1:{server.server_port}", UpstreamConfig(read_timeout=1))
+
+    try:
+        responses = [upstreams.client("local").get("/") for _ in range(3)]
+    finally:
+        upstreams.client("local").close()
+        server.shutdown()
+
+    stats = upstreams.stats()["local"]
+    assert [_.text for _ in responses] == ["OK"] * 3
+    assert (stats.requests, stats.new_connections, stats.reused_connections) == (3, 1, 2)
+
+
+def test_every_processor_of_a_service_shares_its_resilience(monkeypatch):
+    monkeypatch.setenv("SHARED_DEADLINE", "2.5")
+    monkeypatch.setenv("UPSTREAM_BREAKER_FAILURES", "3")
+
+    upstreams = UpstreamClients()
+    upstreams.register("shared", "http://shared.test")
+    resilience = upstreams.resilience("shared")
+
+    assert upstreams.resilience("shared") is resilience
+    assert (resilience.deadline, resilience.breaker.failure_threshold) == (2.5, 3)
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from test.helpers import loop_must_not_block
+from utils.concurrency import gather_or_cancel
+from utils.watchdog import LoopWatchdog
+
+
+class SlowProcessor:
+
+    def get(self, seconds: float) -> str:
+        time.sleep(seconds)
+        return "OK"
+
+    async def async_get(self, seconds: float) -> str:
+        await asyncio.sleep(seconds)
+        return "OK"
+
+
+def build_app() -> FastAPI:
+    app, processor = FastAPI(), SlowProcessor()
+
+    @app.get("/blocking")
+    async def blocking_handler():
+        return processor.get(0.15)
+
+    @app.get("/blocking_in_a_task")
+    async def blocking_in_a_task_handler():
+        async def query():
+            return processor.get(0.15)
+
+        return await gather_or_cancel([query()])
+
+    @app.get("/non_blocking")
+    async def non_blocking_handler():
+        return await processor.async_get(0.15)
+
+    return app
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("path", ["/blocking", "/blocking_in_a_task"])
+async def test_stalls_are_attributed_to_their_route_and_processor(path: str):
+    app, stalls = build_app(), []
+    watchdog = LoopWatchdog(0.05, app.routes, on_stall=stalls.append, processor_packages=(__name__,))
+    watchdog.start()
+
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            await client.get(path)
+        await asyncio.sleep(watchdog.interval)
+    finally:
+        watchdog.stop()
+
+    assert len(stalls) == 1
+    assert stalls[0].duration >= 0.1
+    assert (stalls[0].route, stalls[0].processor) == (path, "SlowProcessor")
+    assert "time.sleep(seconds)" in "".join(stalls[0].stack)
+
+
+@pytest.mark.asyncio
+async def test_loop_must_not_block_fails_only_when_a_handler_blocks():
+    app = build_app()
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        async with loop_must_not_block(50, app.routes):
+            await client.get("/non_blocking")
+
+        with pytest.raises(AssertionError, match="blocked for .* ms in /blocking"):
+            async with loop_must_not_block(50, app.routes):
+                await client.get("/blocking")
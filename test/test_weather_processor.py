@@ -1,9 +1,10 @@
+import asyncio
 from datetime import datetime, timedelta
 from importlib import resources
 
 import pytest
 import respx
-from httpx import Response
+from httpx import Response, HTTPStatusError
 
 from model import WeatherDay, Weather
 from processor import WeatherProcessor
@@ -17,12 +18,20 @@ DAY_4_XML = resources.read_binary("test.resources.weather", "day_4.xml")
 DAY_5_XML = resources.read_binary("test.resources.weather", "day_5.xml")
 DAY_6_XML = resources.read_binary("test.resources.weather", "day_6.xml")
 ALL_DAYS_XML = [DAY_0_XML, DAY_1_XML, DAY_2_XML, DAY_3_XML, DAY_4_XML, DAY_5_XML, DAY_6_XML]
+ALL_DAYS_JSON = [resources.read_binary("test.resources.weather", f"day_{n}.json") for n in range(7)]
 
 
 def _build_url(url: str, location: str, date: str):
     return f"{url}{WeatherProcessor.ENDPOINT}?key=&q={location}&dt={date}"
 
 
+def _fixed_lookup(location: str):
+    async def lookup(_: str) -> str:
+        return location
+
+    return lookup
+
+
 def test_xml_parse():
     date = "2022-04-13"
     expected_result = WeatherDay(
@@ -43,6 +52,33 @@ def test_xml_parse():
     assert weather_data == expected_result
 
 
+def test_json_parse_matches_xml_parse():
+    date = "2022-04-13"
+
+    for day_xml, day_json in zip(ALL_DAYS_XML, ALL_DAYS_JSON):
+        assert WeatherProcessor.parse_json(date, day_json) == WeatherProcessor.parse(date, day_xml)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_get_weather_from_json_endpoint():
+    url, location = "http://localhost", "39.46,-0.36"
+    start_date = datetime(2022, 4, 15)
+    processor = WeatherProcessor(url, "", "", use_json=True)
+    processor.lookup = _fixed_lookup(location)
+
+    for n, day_json in enumerate(ALL_DAYS_JSON):
+        date = (start_date - timedelta(days=n)).strftime("%Y-%m-%d")
+        respx.get(f"{url}{WeatherProcessor.JSON_ENDPOINT}?key=&q={location}&dt={date}").mock(
+            return_value=Response(200, content=day_json)
+        )
+
+    weather = await processor.get("", start_date)
+
+    assert [_.date for _ in weather.dates] == [(start_date - timedelta(days=n)).strftime("%Y-%m-%d") for n in range(7)]
+    assert weather.dates[0] == WeatherProcessor.parse("2022-04-15", DAY_0_XML)
+
+
 @respx.mock
 @pytest.mark.asyncio
 async def test_get_weather_info_for_last_7_days():
@@ -131,7 +167,7 @@ async def test_get_weather_info_for_last_7_days():
     location = "39.46,-0.36"
 
     processor = WeatherProcessor(url, "", "")
-    processor.lookup = lambda _: location
+    processor.lookup = _fixed_lookup(location)
 
     for xml_data, date in zip(ALL_DAYS_XML, [start_date - timedelta(days=n) for n in range(7)]):
         date_str = date.strftime("%Y-%m-%d")
@@ -140,3 +176,48 @@ async def test_get_weather_info_for_last_7_days():
 
     result = await processor.get("", start_date)
     assert result == expected_result
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_get_weather_cancels_pending_days_when_one_fails():
+    start_date = datetime.strptime("2022-04-15", "%Y-%m-%d")
+    url, location = "http://localhost", "39.46,-0.36"
+    cancelled_days = []
+
+    processor = WeatherProcessor(url, "", "")
+    processor.lookup = _fixed_lookup(location)
+
+    async def slow_response(request):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled_days.append(request.url.params["dt"])
+            raise
+
+    respx.get(_build_url(url, location, "2022-04-15")).mock(return_value=Response(500))
+    respx.get(f"{url}{WeatherProcessor.ENDPOINT}").mock(side_effect=slow_response)
+
+    with pytest.raises(HTTPStatusError):
+        await processor.get("", start_date)
+
+    assert len(cancelled_days) == WeatherProcessor.DAYS - 1
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_get_weather_twice_only_fetches_past_days_once():
+    start_date = datetime.strptime("2022-04-15", "%Y-%m-%d")
+    url, location = "http://localhost", "39.46,-0.36"
+
+    processor = WeatherProcessor(url, "", "")
+    processor.lookup = _fixed_lookup(location)
+
+    route = respx.get(f"{url}{WeatherProcessor.ENDPOINT}").mock(return_value=Response(200, content=DAY_0_XML))
+
+    first_result = await processor.get("", start_date)
+    second_result = await processor.get("", start_date)
+
+    assert first_result == second_result
+    assert route.call_count == WeatherProcessor.DAYS
+    assert processor.cache.stats().hits == WeatherProcessor.DAYS